@@ -0,0 +1,145 @@
+import math
+
+import numpy as np
+
+from main import (CHUNK_H, CHUNK_W, H_BLOCKS, IS_BLOCK, PLAYER_JUMP_H, PLAYER_VELOCITY, PT, TICK, BoxMover,
+                  Direction, Simulation)
+
+# action columns
+LEFT, RIGHT, UP, DOWN = range(4)
+
+# observation: [x, y, jump velocity, crouch, stuck from left/right/top] + the tile codes around the player
+VIEW_W, VIEW_H = 8, 6
+
+
+class BatchEnv:
+    # N independent worlds stepped in lockstep. The state of all of them lives in NumPy arrays, and the
+    # update_player_position and jump rules of Simulation, swept moves against the blocks, are applied to all the
+    # worlds at once.
+    # Pizzas and enemies are not simulated.
+    # Every world is a copy of the columns [0, width) of the Simulation world with the given seed. The grid is padded
+    # with VIEW_W floor columns and VIEW_H empty rows on every side, and positions past the padding read the padding,
+    # so the world continues as an endless floor on both sides.
+
+    def __init__(self, n: int, width: int = 256, dt: float = TICK, seed: int = None):
+        self.n = n
+        self.dt = dt
+        template = Simulation(seed)
+        for index in range(math.ceil(width / CHUNK_W)):
+            template.world.load(index)
+        self.gravity = template.GRAVITY
+        self.template = self._grid_from(template, width)
+        self.start = (float(template.player_position[0]), float(template.player_position[1]))
+        self.grid = np.repeat(self.template[None], n, axis=0)  # (n, columns, rows) PT codes, padded, column-major
+        self._flat = self.grid.reshape(-1)
+        self._rows = self.grid.shape[2]
+        self.template_masks = self._masks_from(self.template)
+        self.masks = np.repeat(self.template_masks[None], n, axis=0)  # (n, columns) solidity bitmaps of the grid
+
+        self.x = np.empty(n)
+        self.y = np.empty(n)
+        self.jump_velocity = np.empty(n)
+        self.move = np.zeros(n)  # horizontal move asked by the actions of this step, in tiles
+        self.crouch = np.empty(n, dtype=bool)
+        self.stuck = np.empty((n, 3), dtype=bool)  # [from_left, from_right, from_top]
+        self.direction = np.empty(n, dtype=np.int8)
+        self.resets = np.zeros(n, dtype=np.int64)
+        self._worlds = np.arange(n)
+        self.mover = BoxMover(self._column_masks)
+
+        # flat offsets of the observed tiles from the one of the player
+        dy, dx = np.meshgrid(np.arange(-VIEW_H, VIEW_H + 1), np.arange(-VIEW_W, VIEW_W + 1))
+        self._view = (dx * self._rows + dy).ravel()
+        self._reset(self._worlds)
+
+    @staticmethod
+    def _grid_from(sim: Simulation, width: int) -> np.ndarray:
+        grid = np.zeros((width + 2 * VIEW_W, CHUNK_H + 2 * VIEW_H), dtype=np.uint8)
+        for x in range(width):
+            grid[VIEW_W + x, VIEW_H:VIEW_H + CHUNK_H] = np.frombuffer(sim.tiles.column(x), dtype=np.uint8)
+        floor = grid[:, VIEW_H + H_BLOCKS - 2:VIEW_H + H_BLOCKS]
+        floor[floor == PT.BLANK.value] = PT.BRICK.value
+        return grid
+
+    @staticmethod
+    def _masks_from(grid: np.ndarray) -> np.ndarray:
+        # the TileMap solidity bitmap of every column of the grid, the padding rows hold no blocks
+        blocks = IS_BLOCK[grid[:, VIEW_H:VIEW_H + CHUNK_H]].astype(np.uint64)
+        return np.bitwise_or.reduce(blocks << np.arange(CHUNK_H, dtype=np.uint64), axis=1)
+
+    def _index(self, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+        # flat index of the tiles (x, y) of every world
+        x = np.clip(x, -VIEW_W, self.grid.shape[1] - VIEW_W - 1).astype(np.intp) + VIEW_W
+        y = np.clip(y, -VIEW_H, self._rows - VIEW_H - 1).astype(np.intp) + VIEW_H
+        return (self._worlds * self.grid.shape[1] + x) * self._rows + y
+
+    def reset(self, worlds=None) -> np.ndarray:
+        # worlds: indices or a boolean mask of the worlds to reset, all of them by default
+        self._reset(self._worlds if worlds is None else worlds)
+        return self.observe()
+
+    def _reset(self, worlds):
+        self.grid[worlds] = self.template
+        self.masks[worlds] = self.template_masks
+        self.x[worlds], self.y[worlds] = self.start
+        self.jump_velocity[worlds] = 0
+        self.crouch[worlds] = False
+        self.stuck[worlds] = False
+        self.direction[worlds] = Direction.FRONT.value
+        self.resets[worlds] += 1
+
+    def _column_masks(self, x: np.ndarray) -> np.ndarray:
+        # solidity bitmaps of the columns x of every world
+        x = np.clip(x, -VIEW_W, self.grid.shape[1] - VIEW_W - 1).astype(np.intp) + VIEW_W
+        return self.masks[self._worlds, x]
+
+    def step(self, actions: np.ndarray) -> np.ndarray:
+        # actions: (n, 4) booleans, the columns are LEFT, RIGHT, UP and DOWN
+        actions = np.asarray(actions, dtype=bool)
+        self._reset(self.y > H_BLOCKS + 1)
+        self._handle_inputs(actions)
+        self._update_player_position()
+        return self.observe()
+
+    def _handle_inputs(self, actions: np.ndarray):
+        dt = self.dt
+        velocity = np.where(self.crouch, PLAYER_VELOCITY.get("crouch"), PLAYER_VELOCITY.get("normal"))
+        jump_height = np.where(self.crouch, PLAYER_JUMP_H.get("crouch"), PLAYER_JUMP_H.get("normal"))
+        self.direction[:] = Direction.FRONT.value
+
+        # jump, only when standing on a block
+        jump = ~self.stuck[:, 2] & actions[:, UP] & self._touching()[3]
+        self.jump_velocity[jump] = -np.sqrt(2 * self.gravity * jump_height[jump])
+
+        self.move = np.zeros(self.n)
+        left = actions[:, LEFT]
+        self.move -= np.where(left, dt * velocity, 0)
+        self.direction[left] = Direction.LEFT.value
+        right = actions[:, RIGHT]
+        self.move += np.where(right, dt * velocity, 0)
+        self.direction[right] = Direction.RIGHT.value
+
+        self.crouch = actions[:, DOWN] | (self.crouch & self.stuck[:, 2])
+
+    def _touching(self) -> tuple:
+        height = np.where(self.crouch, 1, 2)
+        return self.mover.touching(self.x, self.y + 1 - height, 1, height)
+
+    def _update_player_position(self):
+        # walk then fall, the same swept moves as Simulation.update_player_position
+        height = np.where(self.crouch, 1, 2)
+        self.x, self.y, self.jump_velocity = self.mover.move(
+            self.x, self.y, 1, height, self.move, self.jump_velocity, self.gravity, self.dt)
+        self.stuck[:] = np.stack(self.mover.touching(self.x, self.y + 1 - height, 1, height)[:3], axis=1)
+
+    def observe(self) -> np.ndarray:
+        # (n, 7 + (2 * VIEW_W + 1) * (2 * VIEW_H + 1)) float32, see the layout at the top of the module
+        # the player tile is kept inside the unpadded grid so the view never leaves the padding of its world
+        x = np.clip(np.floor(self.x), 0, self.grid.shape[1] - 2 * VIEW_W - 1)
+        y = np.clip(np.floor(self.y), 0, CHUNK_H - 1)
+        view = self._flat[self._index(x, y)[:, None] + self._view]
+        obs = np.empty((self.n, 7 + view.shape[1]), dtype=np.float32)
+        obs[:, 0], obs[:, 1], obs[:, 2], obs[:, 3] = self.x, self.y, self.jump_velocity, self.crouch
+        obs[:, 4:7] = self.stuck
+        obs[:, 7:] = view
+        return obs
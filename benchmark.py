@@ -0,0 +1,214 @@
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not on Windows
+    resource = None
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import numpy as np
+
+from main import CHUNK_W, H_BLOCKS, HEIGHT, TICK, W_BLOCKS, WIDTH, Game, Inputs, Level, Maps, PT, Direction
+
+IDLE = Inputs(left=False, right=False, up=False, down=False, throw=False)
+PERCENTILES = (50, 90, 99)
+LONG_LEVEL_CHUNKS = 625  # 20,000 columns
+
+
+# Scenarios build a Game and return it with a function frame -> Inputs. Every frame is one Simulation.step of TICK
+# and one Game.render, so the runs do not depend on the wall clock.
+
+def idle():
+    return Game(WIDTH, HEIGHT), lambda frame: IDLE
+
+
+def walk():
+    # right across map_0 and the generated chunks after it, jumping over the hills
+    return Game(WIDTH, HEIGHT), lambda frame: IDLE._replace(right=True, up=frame % 40 < 2)
+
+
+def pizzas():
+    # 1,000 pizzas always in flight, spread over the rows above the floor
+    game = Game(WIDTH, HEIGHT)
+    sim, rng = game.sim, random.Random(0)
+
+    def inputs(frame: int) -> Inputs:
+        while len(sim.pizzas) < 1000:
+            direction = rng.choice((Direction.LEFT, Direction.RIGHT))
+            sim.pizzas.spawn(sim.player_position[0] + rng.uniform(-W_BLOCKS, W_BLOCKS), rng.randrange(H_BLOCKS - 4),
+                             direction, sim.ticks + sim.pizza_lifetime, rng.choice((PT.PIZZA, PT.MINI_PIZZA)))
+        return IDLE
+    return game, inputs
+
+
+def boxes():
+    # a thick box wall in front of the player, broken by pizzas thrown standing and crouching while walking into it
+    game = Game(WIDTH, HEIGHT)
+    sim = game.sim
+    x0 = int(sim.player_position[0]) + 3
+    for x in range(x0, x0 + 2 * CHUNK_W):
+        for y in range(H_BLOCKS - 8, H_BLOCKS - 2):
+            sim.tiles.set(x, y, PT.BOX)
+    return game, lambda frame: IDLE._replace(right=True, down=frame % 4 < 2, throw=frame % 2 == 0)
+
+
+def _long_level(tiles) -> tuple[int, int]:
+    for index in range(LONG_LEVEL_CHUNKS):
+        Maps.random_chunk(tiles, index, random.Random(index))
+    return W_BLOCKS // 2, 0
+
+
+def long_level():
+    # walking a level file of LONG_LEVEL_CHUNKS generated chunks, loaded on demand
+    game = Game(WIDTH, HEIGHT, Level(Level.compile(_long_level)))
+    return game, lambda frame: IDLE._replace(right=True, up=frame % 40 < 2)
+
+
+SCENARIOS = {"idle": idle, "walk": walk, "pizzas": pizzas, "boxes": boxes, "long_level": long_level}
+
+
+class PhaseTimer:
+    # Wraps methods of the game so every call adds its duration to its phase in the current frame
+
+    def __init__(self):
+        self.frame = {}
+
+    def wrap(self, owner, name: str, phase: str):
+        method = getattr(owner, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.frame[phase] = self.frame.get(phase, 0) + time.perf_counter() - start
+        setattr(owner, name, timed)
+
+    def attach(self, game: Game):
+        sim = game.sim
+        self.wrap(sim.world, "update", "world")
+        self.wrap(sim, "handle_inputs", "inputs")
+        self.wrap(sim, "update_player_position", "player")
+        self.wrap(sim, "update_pizzas_position", "pizzas")
+        self.wrap(sim, "update_enemies", "enemies")
+        self.wrap(game, "draw_parts", "draw_parts")
+        self.wrap(game, "_draw_sprites", "draw_sprites")
+        self.wrap(game, "draw_player", "draw_player")
+        self.wrap(game, "render", "render")
+
+
+def _stats(seconds: list) -> dict:
+    ms = np.array(seconds) * 1000
+    stats = {f"p{p}": float(np.percentile(ms, p)) for p in PERCENTILES}
+    stats["mean"], stats["max"] = float(ms.mean()), float(ms.max())
+    return stats
+
+
+def _peak_rss() -> int:
+    # peak resident set size of the process in bytes, SDL surfaces included, None where it is not available
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run(name: str, frames: int, memory: bool = True) -> dict:
+    # frame time percentiles of the scenario in milliseconds, the peak RSS of the process after it (the scenarios
+    # run one after the other, so it is the peak over the ones so far), then the peak of the Python allocations of
+    # a second run, tracemalloc slows the frames down too much to time them in the same run
+    game, inputs = SCENARIOS[name]()
+    timer = PhaseTimer()
+    timer.attach(game)
+    phases, totals = {}, []
+    for frame in range(frames):
+        timer.frame = {}
+        start = time.perf_counter()
+        game.sim.step(inputs(frame))
+        game.render()
+        totals.append(time.perf_counter() - start)
+        for phase in set(phases) | set(timer.frame):
+            phases.setdefault(phase, [0] * frame).append(timer.frame.get(phase, 0))
+    result = {"frames": frames, "total": _stats(totals), "phases": {phase: _stats(times)
+                                                                    for phase, times in sorted(phases.items())},
+              "peak_rss": _peak_rss()}
+
+    if memory:
+        tracemalloc.start()
+        game, inputs = SCENARIOS[name]()
+        for frame in range(frames):
+            game.sim.step(inputs(frame))
+            game.render()
+        result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def compare(baseline: dict, results: dict, threshold: float, min_ms: float) -> list:
+    # lines describing every percentile or peak memory more than threshold (a fraction) above the baseline, frame
+    # times also have to grow by more than min_ms so the noise of sub-millisecond phases is not reported
+    regressions = []
+    for name, result in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        timings = [("total", result["total"], old["total"])]
+        timings += [(phase, stats, old["phases"][phase]) for phase, stats in result["phases"].items()
+                    if phase in old["phases"]]
+        for phase, stats, old_stats in timings:
+            for key in [f"p{p}" for p in PERCENTILES]:
+                new_ms, old_ms = stats[key], old_stats[key]
+                if new_ms > old_ms * (1 + threshold) and new_ms - old_ms > min_ms:
+                    regressions.append(f"{name} {phase} {key}: {old_ms:.3f} ms -> {new_ms:.3f} ms "
+                                       f"(+{(new_ms / old_ms - 1) * 100 if old_ms else float('inf'):.0f}%)")
+        if "peak_memory" in result and "peak_memory" in old and \
+                result["peak_memory"] > old["peak_memory"] * (1 + threshold):
+            regressions.append(f"{name} peak memory: {old['peak_memory']} -> {result['peak_memory']} bytes")
+        if result.get("peak_rss") and old.get("peak_rss") and result["peak_rss"] > old["peak_rss"] * (1 + threshold):
+            regressions.append(f"{name} peak RSS: {old['peak_rss']} -> {result['peak_rss']} bytes")
+    return regressions
+
+
+def main():
+    # python benchmark.py [scenario ...] [--frames N] [--output results.json] [--compare baseline.json]
+    parser = argparse.ArgumentParser(description="Headless frame time benchmarks of Pizza Boi")
+    parser.add_argument("scenarios", nargs="*", help=f"any of {', '.join(SCENARIOS)}, all of them by default")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--no-memory", action="store_true", help="skip the peak memory runs")
+    parser.add_argument("--output", help="write the JSON results there instead of stdout")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown, 0.10 is 10%%")
+    parser.add_argument("--min-ms", type=float, default=0.05, help="frame time changes below this are noise")
+    args = parser.parse_args()
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}")
+
+    results = {"tick": TICK, "scenarios": {}}
+    for name in args.scenarios or SCENARIOS:
+        results["scenarios"][name] = run(name, args.frames, not args.no_memory)
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(json.load(file), results, args.threshold, args.min_ms)
+        for line in regressions:
+            print("REGRESSION", line, file=sys.stderr)
+        print(f"{len(regressions)} regression(s) against {args.compare}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+import sys
+
+from main import Level, Maps
+
+
+def main():
+    # python compile_level.py <Maps builder, e.g. map_0> <output file>
+    name, path = sys.argv[1:3]
+    with open(path, "wb") as file:
+        file.write(Level.compile(getattr(Maps, name)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from main import EnemyPool, Inputs, Level, Maps, Simulation
+from replay import replay
+
+
+def playthrough(seed: int, builder: str = None, frames: int = 3600, distance: int = 200, enemies: bool = True) -> dict:
+    # a bot walks right through the world of the seed (on the level of the Maps builder, the default level when
+    # None), jumping when it is blocked and throwing pizzas at what blocks it. On the ground it stops to throw at the
+    # closest enemy ahead or right behind it, crouched when the enemy is on its feet row. It passes when it gets
+    # distance columns away from the start without the world being reset; a reset by an enemy is an "enemy" failure,
+    # apart from the terrain ones ("fell", "stuck", "too slow"), and enemies=False plays the world without any.
+    level = Level(Level.compile(getattr(Maps, builder))) if builder else None
+    sim = Simulation(seed, level)
+    if not enemies:
+        sim.world.enemies = EnemyPool()  # a pool nobody steps takes the enemies of the chunks the streamer loads
+        sim.enemies.clear()
+    start_x, resets = sim.player_position[0], sim.resets
+    best_x, best_frame = start_x, 0
+    frame, touching = 0, False
+    for frame in range(1, frames + 1):
+        x, y = sim.player_position
+        live = sim.enemies.live()
+        dx, dy = sim.enemies.x[live] - x, sim.enemies.y[live] - y
+        # it outruns the enemies behind it, so it only turns on the ones that caught up, and keeps moving in the air
+        near = (abs(dy) < 2) & (dx < 8) & (dx > -2)
+        touching = bool(((abs(dx) < 2) & (abs(dy) < 2)).any())  # a reset in this step is then the enemy's
+        blocked = sim.player_stuck[1]
+        if near.any() and sim.collider.touching(x, y, 1, 1)[3]:  # standing
+            closest = abs(dx[near]).argmin()
+            behind, low = dx[near][closest] < 0, dy[near][closest] > -0.5
+            throw = frame % 5 == 0
+            # facing needs a left or right input, so the bot only leans toward the enemy on the frames it throws
+            sim.step(Inputs(left=behind and throw, right=not behind and throw, up=False, down=low, throw=throw))
+        else:
+            sim.step(Inputs(left=False, right=True, up=blocked or frame % 45 == 0, down=False,
+                            throw=blocked and frame % 10 == 0))
+        if sim.player_position[0] > best_x:
+            best_x, best_frame = sim.player_position[0], frame
+        if sim.player_position[0] - start_x >= distance or sim.resets != resets or frame - best_frame > 300:
+            break
+    reached = best_x - start_x
+    failure = None
+    if reached < distance:
+        if sim.resets != resets:
+            failure = "enemy" if touching else "fell"
+        else:
+            failure = "stuck" if frame - best_frame > 300 else "too slow"
+    return {"seed": seed, "builder": builder or "default", "frames": frame, "reached": reached,
+            "passed": failure is None, "failure": failure, "stuck_at": best_x if failure == "stuck" else None}
+
+
+def run_job(job: tuple) -> dict:
+    # ("replay", path) or ("playthrough", seed, builder, frames, distance, enemies), runs in a worker process with
+    # its own game modules, so jobs never share a world
+    start, cpu = time.perf_counter(), time.process_time()
+    kind, *args = job
+    if kind == "replay":
+        result = replay(*args)
+        result["passed"] = result["diverged_at"] is None
+    else:
+        result = playthrough(*args)
+    result.update(kind=kind, seconds=time.perf_counter() - start, cpu_seconds=time.process_time() - cpu,
+                  worker=os.getpid())
+    return result
+
+
+def farm(jobs: list, workers: int = None) -> dict:
+    # runs the jobs on a process pool and aggregates their results into one report
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(run_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as error:  # a broken recording or level fails its job, not the whole run
+                results.append({"kind": futures[future][0], "job": list(futures[future]), "passed": False,
+                                "error": f"{type(error).__name__}: {error}", "seconds": 0.0, "cpu_seconds": 0.0,
+                                "frames": 0})
+    wall = time.perf_counter() - start
+
+    summary = {}
+    for kind in sorted({result["kind"] for result in results}):
+        done = [result for result in results if result["kind"] == kind]
+        cpu = sum(result["cpu_seconds"] for result in done)
+        frames = sum(result["frames"] for result in done)
+        summary[kind] = {"jobs": len(done), "passed": sum(result["passed"] for result in done),
+                         "failed": sum(not result["passed"] for result in done), "frames": frames,
+                         "cpu_seconds": cpu, "steps_per_cpu_second": frames / cpu if cpu else 0.0}
+        failures = [result["failure"] for result in done if result.get("failure")]
+        if failures:  # the enemy failures apart from the terrain ones
+            summary[kind]["failures"] = {failure: failures.count(failure) for failure in sorted(set(failures))}
+    # speedup is the CPU time of the jobs over the wall time, close to the worker count when the cores are free
+    cpu = sum(result["cpu_seconds"] for result in results)
+    results.sort(key=lambda result: (result["kind"], result.get("recording", ""), result.get("seed", 0)))
+    return {"workers": workers or os.cpu_count(), "jobs": len(jobs), "wall_seconds": wall,
+            "jobs_per_second": len(jobs) / wall if wall else 0.0, "speedup": cpu / wall if wall else 0.0,
+            "summary": summary, "results": results}
+
+
+def main():
+    # python farm.py [recording ...] [--seeds 0:100] [--builder map_0] [--no-enemies] [--workers N]
+    #                [--output report.json]
+    parser = argparse.ArgumentParser(description="Run replays and level playthroughs on a process pool")
+    parser.add_argument("recordings", nargs="*", help="recordings made with main.py --record")
+    parser.add_argument("--seeds", metavar="FIRST:LAST", help="play through the worlds of the seeds FIRST..LAST-1")
+    parser.add_argument("--builder", help="Maps builder of the playthrough level, the default level otherwise")
+    parser.add_argument("--frames", type=int, default=3600, help="frame budget of a playthrough")
+    parser.add_argument("--distance", type=int, default=200, help="columns a playthrough has to cover")
+    parser.add_argument("--no-enemies", action="store_true", help="play through the worlds without enemies, so only "
+                        "the terrain can fail")
+    parser.add_argument("--workers", type=int, help="worker processes, one per core by default")
+    parser.add_argument("--output", help="write the JSON report there instead of stdout")
+    args = parser.parse_args()
+
+    jobs = [("replay", path) for path in args.recordings]
+    if args.seeds:
+        first, last = map(int, args.seeds.split(":"))
+        jobs += [("playthrough", seed, args.builder, args.frames, args.distance, not args.no_enemies)
+                 for seed in range(first, last)]
+    if not jobs:
+        parser.error("nothing to run, give recordings and/or --seeds")
+
+    report = farm(jobs, args.workers)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    failed = sum(summary["failed"] for summary in report["summary"].values())
+    print(f"{len(jobs)} jobs, {failed} failed, {report['wall_seconds']:.1f} s on {report['workers']} workers "
+          f"({report['speedup']:.1f}x)", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,23 @@
+import os
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")  # keeps the pygame banner out of the JSON reports on stdout
+
 import pygame
+import argparse
 import math
+import heapq
+import json
+import mmap
+import random
+import struct
+import sys
+import time
+import zlib
+from functools import lru_cache
+import numpy as np
+from array import array
 from enum import Enum
+from typing import NamedTuple
 
 
 # Part Type
@@ -17,18 +34,33 @@ class PT(Enum):
 
 BLOCK_SIZE = 20
 BLOCK_MARGIN = 1
-all_parts = {}
 PART_COLOR = {"brick0": pygame.Color(201, 201, 201), "brick1": "brown", "background": pygame.Color(0, 156, 252),
               "box0": pygame.Color(166, 101, 51), "box1": pygame.Color(207, 135, 81)}
 PLAYER_COLOR = {"head": "orange", "pants": pygame.Color(40, 93, 191), "shoes": "black",
                 "skin": pygame.Color(212, 157, 99), "belt": "black", "shirt": pygame.Color(124, 100, 232)}
 PLAYER_VELOCITY = {"normal": 10, "crouch": 7}
 PLAYER_JUMP_H = {"normal": 4, "crouch": 2}
+ENEMY_COLOR = {"body": pygame.Color(120, 40, 140), "eyes": "white", "feet": "black"}
+ENEMY_VELOCITY = {"patrol": 3, "chase": 6}
+ENEMY_JUMP_H = 2
 BLOCK_PARTS = (PT.BRICK, PT.BOX)
 BREAKABLE_BLOCKS = (PT.BOX,)
 
 WIDTH, HEIGHT = 1280, 720
 W_BLOCKS, H_BLOCKS = WIDTH // BLOCK_SIZE, HEIGHT // BLOCK_SIZE
+CHUNK_W = 32  # columns per tile chunk
+CHUNK_H = H_BLOCKS + 1  # rows 0..H_BLOCKS, the visible world
+TICK = 1 / 60  # default simulation step in seconds
+MAX_CATCH_UP = 5  # simulation steps a frame runs at most, a longer hitch is dropped and the game slows down instead
+TELEPORT = 2  # tiles, a move longer than that in one step (respawn, reused slot) is drawn at once, not blended
+STREAM_MARGIN = 1  # chunks kept loaded past each side of the screen
+STREAM_EVICT = 4  # chunks further than this from the player are evicted
+ENEMY_SIGHT = 12  # enemies closer than this to the player (in columns) start chasing
+SPATIAL_CELL = 4  # side of a SpatialHash cell in tiles
+PROFILE_FRAMES = 300  # frames kept by the FrameProfiler
+HITCH_MS = 50  # a frame longer than this is a hitch, the profile is dumped to a file
+DIRTY_MAX_RECTS = 64  # past this many dirty rectangles (after merging) a frame is drawn whole, it is cheaper
+DIRTY_MAX_AREA = 0.5  # the same past this part of the screen
 e = 0.1
 
 
@@ -38,26 +70,1110 @@ class Direction(Enum):
     RIGHT = 2
 
 
-class Part:
+PT_BY_CODE = tuple(PT)  # PT.value -> PT, the values are 0..n-1
+IS_BLOCK = np.zeros(len(PT), dtype=bool)  # PT.value -> is the tile in BLOCK_PARTS
+IS_BLOCK[[pt.value for pt in BLOCK_PARTS]] = True
+IS_BREAKABLE = np.zeros(len(PT), dtype=bool)  # PT.value -> is the tile in BREAKABLE_BLOCKS
+IS_BREAKABLE[[pt.value for pt in BREAKABLE_BLOCKS]] = True
+SOLID_CODES = frozenset(pt.value for pt in BLOCK_PARTS)
+
+
+class TileMap:
+    # The world is split into columns chunks of CHUNK_W x CHUNK_H tiles, each one is a flat byte array of PT
+    # codes in column-major order, so a column is a contiguous slice. Chunks are created on the first write.
+    # Next to the codes every chunk keeps a solidity bitmap, one int per column with the bit y set when the tile
+    # (x, y) is in BLOCK_PARTS. It is updated on every write, the collision queries only read it.
+    # Every write goes through set(), put_chunk(), drop_chunk(), clear() or restore(), which journal what they change:
+    # the tiles written one by one, and the chunks loaded, dropped or rewritten as a whole. commit() hands the journal
+    # of the frame to the subscribers (render caches, the navigation graph, the network server...), so keeping them
+    # current costs in the number of changed tiles instead of the size of the world. Nothing is journaled while
+    # nobody subscribed.
+
+    def __init__(self):
+        self.chunks = {}  # chunk index -> array("B")
+        self.solid = {}  # chunk index -> list of CHUNK_W column bitmasks
+        self.versions = {}  # chunk index -> version, bumped whenever a tile of the chunk changes
+        self.subscribers = []  # callbacks(tiles, chunks) that commit() gives the changes to
+        self.journal = []  # (x, y) of the tiles set since the last commit(), outside of the replaced chunks
+        self.replaced = set()  # indices of the chunks loaded, dropped or rewritten as a whole since the last commit()
+        self._version = 0
+        self._shared = {}  # chunk index -> the last entry share() made for it
+        self._masks = {}  # chunk index -> (version, solidity bitmaps as a uint64 array) the last column_masks() used
 
-    def __init__(self, x: int, y: int, pt: PT, lifetime: int = None, direction: Direction = None):
-        self.x = x
-        self.y = y
-        self.pt = pt
-        self.lifetime = lifetime
-        self.direction = direction
-        if not self.pt == PT.PIZZA:
-            all_parts[(x, y)] = self
+    @staticmethod
+    def _new_chunk() -> array:
+        return array("B", bytes(CHUNK_W * CHUNK_H))
+
+    def get(self, x: int, y: int) -> PT:
+        if not 0 <= y < CHUNK_H:
+            return PT.BLANK
+        chunk = self.chunks.get(x // CHUNK_W)
+        if chunk is None:
+            return PT.BLANK
+        return PT_BY_CODE[chunk[(x % CHUNK_W) * CHUNK_H + y]]
+
+    def set(self, x: int, y: int, pt: PT):
+        if not 0 <= y < CHUNK_H:
+            raise IndexError(f"row {y} is outside of the world (0..{CHUNK_H - 1})")
+        index = x // CHUNK_W
+        chunk = self.chunks.get(index)
+        if chunk is None:
+            if pt == PT.BLANK:
+                return
+            chunk = self.chunks[index] = self._new_chunk()
+            self.solid[index] = [0] * CHUNK_W
+            if self.subscribers:
+                self.replaced.add(index)
+        i = (x % CHUNK_W) * CHUNK_H + y
+        if chunk[i] != pt.value:
+            if (chunk[i] in SOLID_CODES) != (pt.value in SOLID_CODES):
+                self.solid[index][x % CHUNK_W] ^= 1 << y
+            chunk[i] = pt.value
+            self._version += 1
+            self.versions[index] = self._version
+            if self.subscribers and index not in self.replaced:
+                self.journal.append((x, y))
+
+    def delete(self, x: int, y: int):
+        self.set(x, y, PT.BLANK)
+
+    def clear(self):
+        if self.subscribers:
+            self.replaced.update(self.chunks)
+        self.chunks.clear()
+        self.solid.clear()
+        self.versions.clear()
+        self._shared.clear()
+        self._masks.clear()
+
+    def drop_chunk(self, index: int) -> array:
+        if self.subscribers and index in self.chunks:
+            self.replaced.add(index)
+        self.versions.pop(index, None)
+        self.solid.pop(index, None)
+        self._shared.pop(index, None)
+        self._masks.pop(index, None)
+        return self.chunks.pop(index, None)
+
+    def put_chunk(self, index: int, chunk: array):
+        self.chunks[index] = chunk
+        self.solid[index] = [sum(1 << y for y in range(CHUNK_H) if chunk[start + y] in SOLID_CODES)
+                             for start in range(0, CHUNK_W * CHUNK_H, CHUNK_H)]
+        self._version += 1
+        self.versions[index] = self._version
+        if self.subscribers:
+            self.replaced.add(index)
+
+    def share(self) -> dict:
+        # chunk index -> (version, tiles, solidity) of every chunk as immutable copies. A chunk that did not change
+        # since the last call gets the same entry again, so the snapshots holding them share it.
+        shared = {}
+        for index, chunk in self.chunks.items():
+            entry = self._shared.get(index)
+            if entry is None or entry[0] != self.versions[index]:
+                entry = self._shared[index] = (self.versions[index], chunk.tobytes(), tuple(self.solid[index]))
+            shared[index] = entry
+        return shared
+
+    def restore(self, shared: dict):
+        # puts the chunks back the way share() saw them. Versions are never reused, so a chunk still at the version
+        # of its entry is left alone and only the chunks changed since are copied back.
+        for index in [index for index in self.chunks if index not in shared]:
+            self.drop_chunk(index)
+        for index, entry in shared.items():
+            version, tiles, solid = entry
+            if self.versions.get(index) == version:
+                continue
+            self.chunks[index] = array("B", tiles)
+            self.solid[index] = list(solid)
+            self.versions[index] = version
+            self._shared[index] = entry
+            if self.subscribers:
+                self.replaced.add(index)
+
+    def subscribe(self, callback):
+        # callback(tiles, chunks) is called by every commit() with changes: tiles is a list of the (x, y) set one by
+        # one, a tile can be there more than once, chunks the set of the indices of the chunks to take again as a
+        # whole (the chunk is gone when it is not in self.chunks anymore)
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+        if not self.subscribers:
+            self.journal, self.replaced = [], set()
+
+    def commit(self):
+        # ends the frame of the journal, the owner of the map calls it once its update is done
+        if not self.journal and not self.replaced:
+            return
+        tiles, chunks = self.journal, self.replaced
+        if chunks:
+            # tiles set before their chunk got replaced later in the frame
+            tiles = [tile for tile in tiles if tile[0] // CHUNK_W not in chunks]
+        self.journal, self.replaced = [], set()
+        for callback in list(self.subscribers):
+            callback(tiles, chunks)
+
+    def column(self, x: int) -> array:
+        chunk = self.chunks.get(x // CHUNK_W)
+        if chunk is None:
+            return array("B", bytes(CHUNK_H))
+        start = (x % CHUNK_W) * CHUNK_H
+        return chunk[start:start + CHUNK_H]
+
+    def column_mask(self, x: int) -> int:
+        # solidity bitmap of the column x, bit y is set when the tile (x, y) is a block
+        solid = self.solid.get(x // CHUNK_W)
+        return solid[x % CHUNK_W] if solid is not None else 0
+
+    def column_masks(self, xs: np.ndarray) -> np.ndarray:
+        # solidity bitmaps of the columns xs (an integer array) as uint64, CHUNK_H rows fit in one
+        masks = np.zeros(len(xs), dtype=np.uint64)
+        indices = xs // CHUNK_W
+        first, last = (int(indices.min()), int(indices.max())) if len(xs) else (0, -1)
+        for index in range(first, last + 1) if last - first < 4 else np.unique(indices).tolist():
+            solid = self.solid.get(index)
+            if solid is None:
+                continue
+            entry = self._masks.get(index)
+            if entry is None or entry[0] != self.versions[index]:
+                entry = self._masks[index] = (self.versions[index], np.array(solid, dtype=np.uint64))
+            selected = indices == index if first != last else slice(None)
+            masks[selected] = entry[1][xs[selected] % CHUNK_W]
+        return masks
+
+    def get_many(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        # PT codes of the tiles (xs[i], ys[i]), xs and ys are integer arrays
+        codes = np.zeros(len(xs), dtype=np.uint8)
+        inside = (ys >= 0) & (ys < CHUNK_H)
+        indices = xs // CHUNK_W
+        # the tiles are mostly in a few neighbouring chunks, looping over the span is cheaper than np.unique
+        first, last = (int(indices.min()), int(indices.max())) if len(xs) else (0, -1)
+        for index in range(first, last + 1) if last - first < 4 else np.unique(indices[inside]).tolist():
+            chunk = self.chunks.get(index)
+            if chunk is None:
+                continue
+            selected = inside & (indices == index) if first != last else inside
+            codes[selected] = np.frombuffer(chunk, dtype=np.uint8)[(xs[selected] % CHUNK_W) * CHUNK_H + ys[selected]]
+        return codes
+
+    def iter_range(self, x0: int, x1: int):
+        # yields (x, y, pt) for every non blank tile in the columns x0 <= x < x1
+        for x in range(x0, x1):
+            chunk = self.chunks.get(x // CHUNK_W)
+            if chunk is None:
+                continue
+            start = (x % CHUNK_W) * CHUNK_H
+            for y in range(CHUNK_H):
+                code = chunk[start + y]
+                if code:
+                    yield x, y, PT_BY_CODE[code]
+
+    @property
+    def nbytes(self) -> int:
+        # memory held by the tile codes, CHUNK_H bytes per generated column
+        return sum(len(chunk) * chunk.itemsize for chunk in self.chunks.values())
+
+
+class Collider:
+    # Collision queries against the solidity bitmap of a TileMap. A box is (left, top, width, height) in tiles and
+    # the tile (x, y) covers [x, x + 1) x [y, y + 1), so boxes that only share an edge with a tile do not overlap it.
+    # The swept moves of the boxes are BoxMover's, on top of column_masks().
+
+    def __init__(self, tiles: TileMap):
+        self.tiles = tiles
 
+    @staticmethod
+    def _rows(y0: int, y1: int) -> int:
+        # mask of the rows y0 <= y <= y1 that are inside the world
+        y0, y1 = max(y0, 0), min(y1, CHUNK_H - 1)
+        return ((1 << (y1 - y0 + 1)) - 1) << y0 if y0 <= y1 else 0
+
+    def solid(self, x: int, y: int) -> bool:
+        return 0 <= y < CHUNK_H and bool(self.tiles.column_mask(x) >> y & 1)
+
+    def column_masks(self, xs):
+        # solidity bitmaps of the columns xs, a float array of whole tiles, or the int one of the column xs
+        if isinstance(xs, np.ndarray):
+            return self.tiles.column_masks(xs.astype(np.int64))
+        return self.tiles.column_mask(int(xs))
+
+    def solid_many(self, xs: np.ndarray, ys: np.ndarray) -> np.ndarray:
+        return BoxMover.bit(self.column_masks(xs), ys)
+
+    def any_solid(self, x0: int, x1: int, y0: int, y1: int) -> bool:
+        # is there a block in the tiles x0 <= x <= x1, y0 <= y <= y1
+        rows = self._rows(y0, y1)
+        return bool(rows) and any(self.tiles.column_mask(x) & rows for x in range(x0, x1 + 1))
+
+    def touching(self, left: float, top: float, width: float, height: float) -> tuple[bool, bool, bool, bool]:
+        # (left, right, above, below), is there a block sharing that side of the box
+        right, bottom = left + width, top + height
+        x0, x1 = math.floor(left), math.ceil(right) - 1
+        y0, y1 = math.floor(top), math.ceil(bottom) - 1
+        return (left % 1 == 0 and self.any_solid(int(left) - 1, int(left) - 1, y0, y1),
+                right % 1 == 0 and self.any_solid(int(right), int(right), y0, y1),
+                top % 1 == 0 and self.any_solid(x0, x1, int(top) - 1, int(top) - 1),
+                bottom % 1 == 0 and self.any_solid(x0, x1, int(bottom), int(bottom)))
+
+
+class BoxMover:
+    # The walk and fall of the player, the enemies and the BatchEnv worlds. Boxes stand on the row y like the player:
+    # (x, y + 1 - height) is the top left corner, the coordinates are whole tiles and widths and heights are at most
+    # 2. masks(xs) gives the solidity bitmaps of the columns xs, bit y set when the tile (x, y) is a block and
+    # nothing outside of the rows 0..CHUNK_H - 1.
+    # The same code moves one box given as floats, with int masks, and many boxes at once given as float arrays, with
+    # uint64 masks: it only uses the operators both support, and _select(), _most(), bit() and rows() where they
+    # differ, so the player does not pay the NumPy call overhead of one-element arrays. A sweep tests a whole column
+    # of a box with one mask, and a fall ORs the columns under the boxes once.
+
+    def __init__(self, masks):
+        self.masks = masks
 
-class Game:
+    @staticmethod
+    def _select(condition, a, b):
+        # np.where on arrays, a plain conditional on one box
+        return np.where(condition, a, b) if isinstance(condition, np.ndarray) else a if condition else b
 
-    def __init__(self, width: int, height: int):
-        pygame.init()
-        self.running = True
-        self.screen = pygame.display.set_mode((width, height))
-        self.clock = pygame.time.Clock()
-        pygame.display.set_caption("Pizza Boi")
+    @staticmethod
+    def _most(values) -> int:
+        # the largest of the values of the boxes
+        return int(values.max(initial=0)) if isinstance(values, np.ndarray) else int(values)
+
+    @staticmethod
+    def bit(masks, y):
+        # is the bit y of the masks set, False for the rows outside of the world
+        if not isinstance(masks, np.ndarray):
+            return 0 <= y < CHUNK_H and bool(masks >> int(y) & 1)
+        inside = (y >= 0) & (y < CHUNK_H)
+        return inside & (masks >> np.where(inside, y, 0).astype(np.uint64) & np.uint64(1) != 0)
+
+    @staticmethod
+    def rows(top, height):
+        # masks of the rows overlapping [top, top + height), clipped to the world
+        if not isinstance(top, np.ndarray):
+            return Collider._rows(math.floor(top), math.ceil(top + height) - 1)
+        y0 = np.minimum(np.maximum(np.floor(top), 0), CHUNK_H).astype(np.uint64)
+        y1 = np.minimum(np.maximum(np.ceil(top + height), 0), CHUNK_H).astype(np.uint64)
+        return ((np.uint64(1) << y1 - y0) - np.uint64(1)) << y0
+
+    def columns(self, left, width):
+        # the masks of the columns overlapping [left, left + width) ORed together
+        x = left // 1
+        masks = self.masks(x)
+        for column in range(1, self._most(width) + 1):
+            masks = masks | self._select(x + column < left + width, self.masks(x + column), 0)
+        return masks
+
+    def blocked(self, x, y):
+        # are the tiles (x, y) blocks
+        return self.bit(self.masks(x), y)
+
+    def touching(self, x, top, width, height) -> tuple:
+        # (left, right, above, below) of every box, see Collider.touching
+        right, bottom = x + width, top + height
+        rows, columns = self.rows(top, height), self.columns(x, width)
+        return ((x % 1 == 0) & (self.masks(x - 1) & rows != 0),
+                (right % 1 == 0) & (self.masks(right) & rows != 0),
+                (top % 1 == 0) & self.bit(columns, top - 1),
+                (bottom % 1 == 0) & self.bit(columns, bottom))
+
+    @classmethod
+    def sweep(cls, start, size, delta, blocked) -> tuple:
+        # the intervals [start, start + size) move by delta along one axis, blocked(tile) tells which tile lines stop
+        # them. Returns (hit, tile) with the first tile line each of them touches. Only the tile lines between the
+        # interval and the end of its move are tested, so the tiles it already overlaps do not stop it (a box pushed
+        # into a wall can still get out of it) and a move shorter than a tile tests one line at most.
+        forward = delta > 0
+        lead = cls._select(forward, start + size, -start)  # the leading edge, mirrored when moving back
+        first = -(-lead // 1)
+        count = cls._select(delta != 0, (lead + abs(delta)) // 1 - first + 1, 0)
+        hit, hit_tile = count < 0, first
+        for line in range(cls._most(count)):
+            tile = cls._select(forward, first + line, -first - line - 1)
+            hit_tile = cls._select(hit, hit_tile, tile)
+            hit = hit | (line < count) & blocked(tile)
+        return hit, hit_tile
+
+    def move(self, x, y, width, height, move, jump_velocity, gravity: float, dt: float) -> tuple:
+        # walks the boxes by move then lets them fall, returns their new (x, y, jump_velocity)
+        top = y + 1 - height
+        rows = self.rows(top, height)
+        hit, column = self.sweep(x, width, move, lambda column: self.masks(column) & rows != 0)
+        x = self._select(hit, self._select(move > 0, column - width, column + 1), x + move)
+
+        dy = jump_velocity * dt + 0.5 * gravity * dt ** 2
+        columns = self.columns(x, width)
+        hit, row = self.sweep(top, height, dy, lambda row: self.bit(columns, row))
+        y = self._select(hit, self._select(dy > 0, row - 1, row + height), y + dy)
+        jump_velocity = self._select(hit, 0, jump_velocity + gravity * dt)
+        return x, y, jump_velocity
+
+
+class SlotPool:
+    # Fixed capacity pool of entities stored as parallel arrays, subclasses add their own arrays and a spawn().
+    # Freed slots are reused lowest first, so the live ones stay packed under `size`.
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.free = []  # heap of the free slots below end, the ones from end on are all free
+        self.end = 0
+        self.size = 0  # every live slot is below size
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _take(self) -> int:
+        # a free slot marked alive, or -1 when the pool is full
+        if self.free:
+            i = heapq.heappop(self.free)
+        elif self.end < self.capacity:
+            i = self.end
+            self.end += 1
+        else:
+            return -1
+        self.alive[i] = True
+        self.size = max(self.size, i + 1)
+        self.count += 1
+        return i
+
+    def kill(self, slots: np.ndarray):
+        self.alive[slots] = False
+        for i in slots.tolist():
+            heapq.heappush(self.free, i)
+        self.count -= len(slots)
+        while self.size and not self.alive[self.size - 1]:
+            self.size -= 1
+
+    def clear(self):
+        self.kill(self.live())
+
+    def live(self) -> np.ndarray:
+        return np.flatnonzero(self.alive[:self.size])
+
+    def pack(self) -> bytes:
+        # the live slots and their values in the ARRAYS of the subclass
+        live = self.live()
+        return b"".join([struct.pack("<I", len(live)), live.astype(np.int32).tobytes()] +
+                        [getattr(self, name)[live].tobytes() for name in self.ARRAYS])
+
+    def unpack(self, data, offset: int = 0) -> int:
+        # puts back the slots of pack() found at offset in data, returns the offset after them
+        count, = struct.unpack_from("<I", data, offset)
+        live = np.frombuffer(data, dtype=np.int32, count=count, offset=offset + 4)
+        offset += 4 + live.nbytes
+        self.alive[:] = False
+        self.alive[live] = True
+        for name in self.ARRAYS:
+            values = getattr(self, name)
+            values[live] = np.frombuffer(data, dtype=values.dtype, count=count, offset=offset)
+            offset += count * values.itemsize
+        self.size = self.end = int(live[-1]) + 1 if count else 0
+        self.count = count
+        self.free = np.flatnonzero(~self.alive[:self.size]).tolist()  # sorted, so already a heap
+        return offset
+
+
+class ProjectilePool(SlotPool):
+    # The flying pizzas, movement, expiry and tile collision run on all the live slots at once
+    ARRAYS = ("x", "y", "direction", "expiry", "kind")
+
+    def __init__(self, capacity: int = 4096):
+        super().__init__(capacity)
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.direction = np.zeros(capacity, dtype=np.int8)  # -1 left, 1 right
+        self.expiry = np.zeros(capacity)  # simulation ticks (ms) the projectile disappears after
+        self.kind = np.zeros(capacity, dtype=np.uint8)  # PT code
+
+    def spawn(self, x: float, y: float, direction: Direction, expiry: float, kind: PT) -> int:
+        # returns the slot of the new projectile, or -1 when the pool is full
+        i = self._take()
+        if i >= 0:
+            self.x[i], self.y[i], self.expiry[i], self.kind[i] = x, y, expiry, kind.value
+            self.direction[i] = -1 if direction == Direction.LEFT else 1
+        return i
+
+    def expire(self, ticks: float):
+        n = self.size
+        self.kill(np.flatnonzero(self.alive[:n] & (self.expiry[:n] < ticks)))
+
+    def move(self, distance: float):
+        n = self.size
+        self.x[:n] += np.where(self.alive[:n], self.direction[:n] * distance, 0)
+
+    def collide(self, collider: Collider, lifetime: float, moved: float) -> set:
+        # ends the projectiles that touched a block while moving `moved` tiles, returns the breakable tiles they hit.
+        # A projectile covers the columns floor(x)..ceil(x) of its row, the ones it swept over are checked in the
+        # order it passed them, so at a large dt it still stops at the first block on its way.
+        slots = self.live()
+        if not len(slots):
+            return set()
+        x, y, direction = self.x[slots], np.ceil(self.y[slots]).astype(np.int64), self.direction[slots]
+        first = np.floor(np.minimum(x, x - direction * moved)).astype(np.int64)
+        last = np.ceil(np.maximum(x, x - direction * moved)).astype(np.int64)
+        first, last = np.where(direction > 0, first, last), np.where(direction > 0, last, first)
+
+        hit_x = np.zeros(len(slots), dtype=np.int64)
+        hit = np.zeros(len(slots), dtype=bool)
+        for step in range(int((np.abs(last - first)).max(initial=-1)) + 1):
+            tile_x = first + direction * step
+            new = ~hit & (direction * (last - tile_x) >= 0) & collider.solid_many(tile_x, y)
+            hit_x[new] = tile_x[new]
+            hit |= new
+        self.expiry[slots[hit]] -= lifetime
+
+        breakable = hit & IS_BREAKABLE[collider.tiles.get_many(hit_x, y)]
+        return set(zip(hit_x[breakable].tolist(), y[breakable].tolist()))
+
+
+class SpatialHash:
+    # Uniform grid broad phase for boxes (left, top, width, height) no larger than a cell. build() files every box
+    # under the cells it covers, overlaps() then only compares a query box with the boxes of the cells it covers.
+
+    def __init__(self, cell: int = SPATIAL_CELL):
+        self.cell = cell
+        self.keys = np.zeros(0, dtype=np.int64)  # sorted cell keys, one entry per (box, covered cell)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.boxes = np.zeros((4, 0))  # left, top, right and bottom of every entry
+
+    def _cells(self, left, top, width, height):
+        # (cell keys, valid) of the up to 2 x 2 cells covered by each box
+        x0, y0 = np.floor(left / self.cell), np.floor(top / self.cell)
+        x1, y1 = np.ceil((left + width) / self.cell) - 1, np.ceil((top + height) / self.cell) - 1
+        for dx in (0, 1):
+            for dy in (0, 1):
+                key = ((x0 + dx) * 65536 + y0 + dy).astype(np.int64)
+                yield key, (x0 + dx <= x1) & (y0 + dy <= y1)
+
+    def build(self, ids: np.ndarray, left: np.ndarray, top: np.ndarray, width, height):
+        width, height = np.broadcast_to(width, left.shape), np.broadcast_to(height, left.shape)
+        keys, entries = [], []
+        for key, valid in self._cells(left, top, width, height):
+            keys.append(key[valid])
+            entries.append(np.flatnonzero(valid))
+        keys, entries = np.concatenate(keys), np.concatenate(entries)
+        order = np.argsort(keys, kind="stable")
+        entries = entries[order]
+        self.keys, self.ids = keys[order], ids[entries]
+        self.boxes = np.stack((left[entries], top[entries], (left + width)[entries], (top + height)[entries]))
+
+    def overlaps(self, left: np.ndarray, top: np.ndarray, width, height) -> tuple[np.ndarray, np.ndarray]:
+        # (query index, id) of every filed box overlapping one of the query boxes, each pair once
+        width, height = np.broadcast_to(width, left.shape), np.broadcast_to(height, left.shape)
+        queries, entries = [], []
+        for key, valid in self._cells(left, top, width, height):
+            first = np.searchsorted(self.keys, key, "left")
+            counts = np.where(valid, np.searchsorted(self.keys, key, "right") - first, 0)
+            starts = np.repeat(np.cumsum(counts) - counts, counts)
+            queries.append(np.repeat(np.arange(len(left)), counts))
+            entries.append(np.repeat(first, counts) + np.arange(counts.sum()) - starts)
+        queries, entries = np.concatenate(queries), np.concatenate(entries)
+
+        box_left, box_top, box_right, box_bottom = self.boxes[:, entries]
+        overlap = (left[queries] < box_right) & (box_left < (left + width)[queries]) & \
+                  (top[queries] < box_bottom) & (box_top < (top + height)[queries])
+        pairs = np.unique(np.stack((queries[overlap], self.ids[entries[overlap]])), axis=1)
+        return pairs[0], pairs[1]
+
+
+class EnemyPool(SlotPool):
+    # Enemies: position, walk direction, fall velocity, AI state and hit box of every one in parallel arrays. They
+    # stand on the row y like the player and walk and fall with the same BoxMover rules. A patrolling enemy walks
+    # until a wall or a ledge and turns back, it chases the player when he comes close and jumps over walls.
+    PATROL, CHASE = 0, 1
+    ARRAYS = ("x", "y", "direction", "jump_velocity", "state", "width", "height")
+
+    def __init__(self, capacity: int = 1024):
+        super().__init__(capacity)
+        self.x = np.zeros(capacity)
+        self.y = np.zeros(capacity)
+        self.direction = np.zeros(capacity, dtype=np.int8)  # -1 left, 1 right
+        self.jump_velocity = np.zeros(capacity)
+        self.state = np.zeros(capacity, dtype=np.uint8)
+        self.width = np.ones(capacity)
+        self.height = np.ones(capacity)
+
+    def spawn(self, x: float, y: float, width: float = 1, height: float = 1) -> int:
+        # returns the slot of the new enemy, or -1 when the pool is full
+        i = self._take()
+        if i >= 0:
+            self.x[i], self.y[i], self.width[i], self.height[i] = x, y, width, height
+            self.direction[i], self.jump_velocity[i], self.state[i] = -1, 0, self.PATROL
+        return i
+
+    def boxes(self, slots: np.ndarray) -> tuple:
+        # (left, top, width, height) of the enemies
+        height = self.height[slots]
+        return self.x[slots], self.y[slots] + 1 - height, self.width[slots], height
+
+    def think(self, slots: np.ndarray, player: tuple[float, float]):
+        dx, dy = player[0] - self.x[slots], player[1] - self.y[slots]
+        chase = (np.abs(dx) < ENEMY_SIGHT) & (np.abs(dy) < 3)
+        self.state[slots] = np.where(chase, self.CHASE, self.PATROL)
+        self.direction[slots] = np.where(chase & (dx != 0), np.sign(dx), self.direction[slots])
+
+    def move(self, slots: np.ndarray, mover: BoxMover, gravity: float, dt: float):
+        x, y, width, height = self.x[slots], self.y[slots], self.width[slots], self.height[slots]
+        direction, jump_velocity = self.direction[slots], self.jump_velocity[slots]
+        chase = self.state[slots] == self.CHASE
+
+        touching = mover.touching(x, y + 1 - height, width, height)
+        wall = np.where(direction > 0, touching[1], touching[0])
+        front = np.where(direction > 0, np.floor(x + width), np.ceil(x) - 1)  # column the front edge walks over
+        ledge = touching[3] & ~mover.blocked(front, y + 1)
+        direction = np.where(~chase & (wall | ledge), -direction, direction)
+        jump = chase & wall & touching[3]
+        jump_velocity = np.where(jump, -(2 * gravity * ENEMY_JUMP_H) ** 0.5, jump_velocity)
+
+        speed = np.where(chase, ENEMY_VELOCITY.get("chase"), ENEMY_VELOCITY.get("patrol"))
+        x, y, jump_velocity = mover.move(x, y, width, height, direction * speed * dt, jump_velocity, gravity, dt)
+        self.x[slots], self.y[slots], self.jump_velocity[slots], self.direction[slots] = x, y, jump_velocity, direction
+
+
+class Level:
+    # Compiled hand-made level. The format (little endian) is a header, a chunk index sorted by chunk, then the
+    # tiles of every chunk as one PT code byte per tile in the TileMap layout:
+    #   header  magic "PZLV", version u16, CHUNK_W u16, CHUNK_H u16, start x i32, start y i32, chunk count u32
+    #   index   chunk index i32, offset of the tiles from the start of the file u32
+    # A Level reads from any buffer, open() memory-maps the file so only the chunks that get loaded are read.
+    MAGIC = b"PZLV"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHHHiiI")
+    ENTRY = struct.Struct("<iI")
+
+    def __init__(self, buffer):
+        magic, version, chunk_w, chunk_h, start_x, start_y, count = self.HEADER.unpack_from(buffer, 0)
+        if magic != self.MAGIC:
+            raise ValueError("not a level file")
+        if version != self.VERSION:
+            raise ValueError(f"level format version {version} is not supported (expected {self.VERSION})")
+        if (chunk_w, chunk_h) != (CHUNK_W, CHUNK_H):
+            raise ValueError(f"level chunks are {chunk_w}x{chunk_h}, the game uses {CHUNK_W}x{CHUNK_H}")
+
+        self.buffer = buffer
+        self.start = (start_x, start_y)
+        self.offsets = dict(self.ENTRY.iter_unpack(buffer[self.HEADER.size:self.HEADER.size + count * self.ENTRY.size]))
+
+    @classmethod
+    def open(cls, path: str) -> "Level":
+        with open(path, "rb") as file:
+            return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @staticmethod
+    def compile(build) -> bytes:
+        # build(tiles) writes the level into a TileMap and returns the player start position
+        tiles = TileMap()
+        start = build(tiles)
+        for index in list(tiles.chunks):
+            for x in range(index * CHUNK_W, (index + 1) * CHUNK_W):
+                tiles.set(x, H_BLOCKS - 1, PT.BRICK)
+                tiles.set(x, H_BLOCKS - 2, PT.BRICK)
+
+        indices = sorted(tiles.chunks)
+        offset = Level.HEADER.size + len(indices) * Level.ENTRY.size
+        header = Level.HEADER.pack(Level.MAGIC, Level.VERSION, CHUNK_W, CHUNK_H, start[0], start[1], len(indices))
+        entries = [Level.ENTRY.pack(index, offset + i * CHUNK_W * CHUNK_H) for i, index in enumerate(indices)]
+        return b"".join([header] + entries + [tiles.chunks[index].tobytes() for index in indices])
+
+    def __contains__(self, index: int) -> bool:
+        return index in self.offsets
+
+    def chunk(self, index: int) -> array:
+        offset = self.offsets[index]
+        return array("B", self.buffer[offset:offset + CHUNK_W * CHUNK_H])
+
+
+class WorldStreamer:
+    # Keeps only the chunks around the player in the TileMap. Missing chunks are loaded when they come near, from the
+    # level when it has them, otherwise generated: the floor plus Maps.random_chunk, seeded per chunk so a chunk is
+    # always generated the same way (only the floor when the seed is None). Chunks far from the player are evicted.
+    # An evicted chunk the player changed (a broken box) is kept zlib compressed and restored when the player comes
+    # back. ENEMY tiles of a loaded chunk become enemies of the pool, the ones still alive go back into the chunk as
+    # ENEMY tiles when it is evicted.
+
+    def __init__(self, tiles: TileMap, level: Level, seed: int = None, enemies: EnemyPool = None):
+        self.tiles = tiles
+        self.level = level
+        self.seed = seed
+        self.enemies = enemies
+        self.generated = {}  # loaded chunk index -> its version right after it was generated or restored
+        self.saved = {}  # evicted chunk index -> compressed tiles
+
+    def reset(self):
+        self.generated.clear()
+        self.saved.clear()
+
+    def load(self, index: int):
+        if index in self.generated:
+            return
+        data = self.saved.pop(index, None)
+        if data is not None:
+            self.tiles.put_chunk(index, array("B", zlib.decompress(data)))
+        elif index in self.level:
+            self.tiles.put_chunk(index, self.level.chunk(index))
+        else:
+            x0 = index * CHUNK_W
+            for x in range(x0, x0 + CHUNK_W):
+                self.tiles.set(x, H_BLOCKS - 1, PT.BRICK)
+                self.tiles.set(x, H_BLOCKS - 2, PT.BRICK)
+            if self.seed is not None:
+                Maps.random_chunk(self.tiles, index, random.Random(self.seed * 1_000_003 + index))
+        self.generated[index] = self.tiles.versions[index]
+        if self.enemies is not None:
+            self._spawn_enemies(index)
+
+    def _spawn_enemies(self, index: int):
+        # after generated[] is set, so a chunk that had enemies is always saved with the ones still alive
+        data = self.tiles.chunks[index].tobytes()
+        i = data.find(PT.ENEMY.value)
+        while i >= 0:
+            x, y = index * CHUNK_W + i // CHUNK_H, i % CHUNK_H
+            if self.enemies.spawn(x, y) >= 0:
+                self.tiles.delete(x, y)
+            i = data.find(PT.ENEMY.value, i + 1)
+
+    def _store_enemies(self, index: int):
+        slots = self.enemies.live()
+        slots = slots[np.floor(self.enemies.x[slots]) // CHUNK_W == index]
+        for x, y in zip(np.floor(self.enemies.x[slots]).tolist(), np.floor(self.enemies.y[slots]).tolist()):
+            if 0 <= y < CHUNK_H and self.tiles.get(int(x), int(y)) == PT.BLANK:
+                self.tiles.set(int(x), int(y), PT.ENEMY)
+        self.enemies.kill(slots)
+
+    def evict(self, index: int):
+        if self.enemies is not None:
+            self._store_enemies(index)
+        version = self.generated.pop(index)
+        edited = self.tiles.versions.get(index) != version
+        chunk = self.tiles.drop_chunk(index)
+        if chunk is not None and edited:
+            self.saved[index] = zlib.compress(chunk.tobytes())
+
+    def update(self, *xs: float):
+        # xs are the columns of the players, the chunks far from all of them are evicted
+        players = [math.floor(x) // CHUNK_W for x in xs]
+        for x in xs:
+            first = (math.floor(x) - W_BLOCKS // 2) // CHUNK_W - STREAM_MARGIN
+            last = (math.floor(x) + W_BLOCKS // 2) // CHUNK_W + STREAM_MARGIN
+            for index in range(first, last + 1):
+                self.load(index)
+        for index in [index for index in self.generated
+                      if all(abs(index - player) > STREAM_EVICT for player in players)]:
+            self.evict(index)
+
+
+class ChunkRenderer:
+    # Bakes the static tiles of every chunk into an off-screen surface, so drawing the terrain costs a few blits
+    # per frame. The change journal of the tiles tells which tiles of a surface are stale, only those are drawn
+    # again, a surface is rendered whole when its chunk was replaced or it holds sprites overflowing their tile.
+    TILE_PARTS = (PT.BLANK, PT.BRICK, PT.BOX)  # parts drawn exactly inside their tile
+
+    def __init__(self, tiles: TileMap, draw_part):
+        self.tiles = tiles
+        self.draw_part = draw_part  # draw_part(pt, left, top, surface)
+        self.surfaces = {}  # chunk index -> Surface
+        self.stale = {}  # chunk index -> set of the (x, y) to draw again, None to render the whole surface again
+        self.overflowing = set()  # chunks whose surface has sprites drawn over the tiles around theirs
+        self.redrawn = 0  # chunk surfaces rendered again, counted until the caller resets them
+        self.tiles_drawn = 0
+        self.blits = 0
+        tiles.subscribe(self.on_changes)
+
+    def on_changes(self, tiles: list, chunks: set):
+        for index in chunks:
+            if index in self.surfaces:
+                self.stale[index] = None
+        for x, y in tiles:
+            index = x // CHUNK_W
+            if index in self.surfaces and self.stale.get(index, ()) is not None:
+                if index in self.overflowing or self.tiles.get(x, y) not in self.TILE_PARTS:
+                    self.stale[index] = None
+                else:
+                    self.stale.setdefault(index, set()).add((x, y))
+
+    def surface(self, index: int, screen: pygame.Surface) -> pygame.Surface:
+        surface = self.surfaces.get(index)
+        if surface is not None and index not in self.stale:
+            return surface
+
+        x0 = index * CHUNK_W
+        stale = self.stale.pop(index, None)
+        if surface is not None and stale is not None:
+            background = PART_COLOR.get("background")
+            for x, y in stale:
+                left, top = (x - x0) * BLOCK_SIZE, y * BLOCK_SIZE
+                surface.fill(background, (left, top, BLOCK_SIZE, BLOCK_SIZE))
+                self.draw_part(self.tiles.get(x, y), left, top, surface)
+                self.tiles_drawn += 1
+            return surface
+
+        if surface is None:
+            surface = self.surfaces[index] = pygame.Surface((CHUNK_W * BLOCK_SIZE, CHUNK_H * BLOCK_SIZE), 0, screen)
+        surface.fill(PART_COLOR.get("background"))
+        self.overflowing.discard(index)
+        for (x, y, pt) in self.tiles.iter_range(x0, x0 + CHUNK_W):
+            self.draw_part(pt, (x - x0) * BLOCK_SIZE, y * BLOCK_SIZE, surface)
+            self.tiles_drawn += 1
+            if pt not in self.TILE_PARTS:
+                self.overflowing.add(index)
+        self.redrawn += 1
+        return surface
+
+    def draw(self, screen: pygame.Surface, left_border_x: int, offset: float):
+        # left_border_x is the first visible column, offset the fraction of it that is scrolled out of the screen
+        first, last = left_border_x // CHUNK_W, (left_border_x + W_BLOCKS + 1) // CHUNK_W
+        for index in range(first, last + 1):
+            if index not in self.tiles.chunks:
+                continue
+            left = round((index * CHUNK_W - left_border_x - offset) * BLOCK_SIZE)
+            screen.blit(self.surface(index, screen), (left, 0))
+            self.blits += 1
+
+        # keep only the surfaces around the screen
+        for index in [index for index in self.surfaces if not first - 1 <= index <= last + 1]:
+            del self.surfaces[index]
+            self.stale.pop(index, None)
+            self.overflowing.discard(index)
+
+    def draw_area(self, screen: pygame.Surface, rect: pygame.Rect, left_border_x: int, offset: float):
+        # draws only the part of the terrain under rect, one area blit per chunk it covers
+        first = (left_border_x + math.floor(rect.left / BLOCK_SIZE + offset)) // CHUNK_W
+        last = (left_border_x + math.floor(rect.right / BLOCK_SIZE + offset)) // CHUNK_W
+        for index in range(first, last + 1):
+            if index not in self.tiles.chunks:
+                continue
+            left = round((index * CHUNK_W - left_border_x - offset) * BLOCK_SIZE)
+            area = rect.move(-left, 0).clip((0, 0, CHUNK_W * BLOCK_SIZE, CHUNK_H * BLOCK_SIZE))
+            if area.w and area.h:
+                screen.blit(self.surface(index, screen), (left + area.x, area.y), area)
+                self.blits += 1
+
+
+class SpriteAtlas:
+    # Lazily renders every sprite (player pose, pizza, enemy) once into a slot of a single atlas surface, drawing a
+    # sprite is then one blit. Sprites are drawn inside their slot around the origin (BLOCK_SIZE // 2, 2 * BLOCK_SIZE),
+    # validate() drops the atlas when BLOCK_SIZE, PLAYER_COLOR or ENEMY_COLOR changed, the renderer calls it once per
+    # frame so a blit stays a lookup and one blit.
+    COLORKEY = (255, 0, 255)
+
+    def __init__(self, screen: pygame.Surface):
+        self.screen = screen
+        self.slots = {}  # sprite key -> (area in the atlas, offset of the area from the slot origin)
+        self.surface = None
+        self.key = None
+
+    @staticmethod
+    def _settings_key() -> tuple:
+        return BLOCK_SIZE, tuple((name, tuple(pygame.Color(color)))
+                                 for colors in (PLAYER_COLOR, ENEMY_COLOR) for name, color in colors.items())
+
+    def _new_surface(self, slots: int) -> pygame.Surface:
+        surface = pygame.Surface((slots * 2 * BLOCK_SIZE, 3 * BLOCK_SIZE), 0, self.screen)
+        surface.fill(self.COLORKEY)
+        surface.set_colorkey(self.COLORKEY, pygame.RLEACCEL)
+        return surface
+
+    def _add(self, key, draw) -> pygame.Rect:
+        slot_w, slot_h = 2 * BLOCK_SIZE, 3 * BLOCK_SIZE
+        if self.surface is None:
+            self.surface = self._new_surface(16)
+        elif (len(self.slots) + 1) * slot_w > self.surface.get_width():
+            surface = self._new_surface(2 * len(self.slots))
+            surface.blit(self.surface, (0, 0))
+            self.surface = surface
+
+        slot = pygame.Rect(len(self.slots) * slot_w, 0, slot_w, slot_h)
+        sprite = self.surface.subsurface(slot)
+        draw(sprite, BLOCK_SIZE // 2, 2 * BLOCK_SIZE)
+
+        # blit only the pixels the sprite really covers, it keeps the dirty rectangles small
+        bounds = sprite.get_bounding_rect()
+        self.slots[key] = (bounds.move(slot.x, 0), (bounds.x - BLOCK_SIZE // 2, bounds.y - 2 * BLOCK_SIZE))
+        return self.slots[key]
+
+    def validate(self):
+        settings_key = self._settings_key()
+        if settings_key != self.key:
+            self.slots.clear()
+            self.surface = None
+            self.key = settings_key
+
+    def blit(self, screen: pygame.Surface, key, draw, left, top) -> pygame.Rect:
+        # draw(surface, left, top) renders the sprite the first time the key is seen, returns the area drawn on screen
+        slot = self.slots.get(key)
+        if slot is None:
+            slot = self._add(key, draw)
+        area, (dx, dy) = slot
+        return screen.blit(self.surface, (math.floor(left) + dx, math.floor(top) + dy), area)
+
+
+class FrameProfiler:
+    # Ring buffer of the time spent in every phase of the last PROFILE_FRAMES frames, plus per frame counters.
+    # lap(phase) charges the time since the previous lap to the phase, end_frame() stores the frame. A frame that
+    # works (every phase but wait, the frame limiter sleep) longer than HITCH_MS is a hitch and dumps the buffer to a
+    # CSV file, at most once per buffer length so a slow spell gives one file.
+    PHASES = ("wait", "inputs", "world", "player", "pizzas", "enemies", "render")
+    COUNTERS = ("pizzas", "enemies", "chunks", "chunk_redraws", "tiles_drawn", "blits", "sprites", "pixels", "steps",
+                "dropped_steps")
+    COLORS = ("gray40", "white", "green", "orange", "red", "purple", "cyan")  # graph color of every phase
+    GRAPH_H = 100  # HUD graph height in pixels, it shows up to 50 ms per frame
+
+    def __init__(self, frames: int = PROFILE_FRAMES):
+        self.times = np.zeros((frames, len(self.PHASES)))  # seconds
+        self.counters = np.zeros((frames, len(self.COUNTERS)), dtype=np.int64)
+        self.frames = 0  # frames recorded so far, the last one is in row (frames - 1) % len(times)
+        self.dump_on_hitch = True
+        self._phase = {phase: i for i, phase in enumerate(self.PHASES)}
+        self._counter = {counter: i for i, counter in enumerate(self.COUNTERS)}
+        self._current = [0.0] * len(self.PHASES)
+        self._current_counters = [0] * len(self.COUNTERS)
+        self._last = time.perf_counter()
+        self._last_dump = -frames
+        self._graph = None
+        self._graphed = 0  # frames drawn into the graph so far
+        self._font = None
+
+    def lap(self, phase: str):
+        now = time.perf_counter()
+        self._current[self._phase[phase]] += now - self._last
+        self._last = now
+
+    def count(self, counter: str, value: int):
+        self._current_counters[self._counter[counter]] = value
+
+    def end_frame(self):
+        row = self.frames % len(self.times)
+        self.times[row] = self._current
+        self.counters[row] = self._current_counters
+        self.frames += 1
+        self._current = [0.0] * len(self.PHASES)
+        busy = (sum(self.times[row]) - self.times[row, self._phase["wait"]]) * 1000
+        if self.dump_on_hitch and busy > HITCH_MS and self.frames - self._last_dump >= len(self.times):
+            path = self.dump()
+            print(f"hitch of {busy:.0f} ms, profile saved to {path}", file=sys.stderr)
+
+    def recent(self) -> tuple[np.ndarray, np.ndarray]:
+        # (times, counters) of the recorded frames, oldest first
+        n = min(self.frames, len(self.times))
+        order = np.arange(self.frames - n, self.frames) % len(self.times)
+        return self.times[order], self.counters[order]
+
+    def summary(self) -> dict:
+        # frame time statistics of the recorded frames (the whole frame, waiting included), in milliseconds
+        times, counters = self.recent()
+        if not len(times):
+            return {"frames": 0}
+        totals = times.sum(axis=1) * 1000
+        busy = totals - times[:, self._phase["wait"]] * 1000
+        steps = counters[:, self._counter["steps"]]
+        return {"frames": len(totals), "fps": 1000 / totals.mean(), "mean_ms": totals.mean(),
+                "p50_ms": np.percentile(totals, 50), "p95_ms": np.percentile(totals, 95),
+                "p99_ms": np.percentile(totals, 99), "max_ms": totals.max(), "jitter_ms": totals.std(),
+                "hitches": int((busy > HITCH_MS).sum()), "steps_per_frame": steps.mean(),
+                "frames_without_step": int((steps == 0).sum()),
+                "dropped_steps": int(counters[:, self._counter["dropped_steps"]].sum()),
+                "phases_ms": {phase: mean for phase, mean in zip(self.PHASES, times.mean(axis=0) * 1000)}}
+
+    def dump(self, path: str = None) -> str:
+        # CSV of the buffer, one row per frame with the phase times in milliseconds and the counters
+        if path is None:
+            path = time.strftime("profile-%Y%m%d-%H%M%S.csv")
+        times, counters = self.recent()
+        with open(path, "w") as file:
+            file.write(",".join(("frame", "total_ms") + tuple(f"{phase}_ms" for phase in self.PHASES) +
+                                self.COUNTERS) + "\n")
+            for i, (row, counts) in enumerate(zip(times * 1000, counters)):
+                values = [f"{value:.3f}" for value in row]
+                file.write(",".join([str(self.frames - len(times) + i), f"{row.sum():.3f}"] + values +
+                                    [str(count) for count in counts.tolist()]) + "\n")
+        self._last_dump = self.frames
+        return path
+
+    def draw(self, screen: pygame.Surface) -> pygame.Rect:
+        # HUD: a scrolling stacked graph of the phase times and a few lines of averages and counters
+        width = len(self.times)
+        if self._graph is None:
+            self._graph = pygame.Surface((width, self.GRAPH_H))
+            self._graph.fill("black")
+            self._font = pygame.font.Font(None, 18)
+            self._graphed = self.frames
+        for row in self.times[np.arange(max(self._graphed, self.frames - width), self.frames) % width]:
+            self._graph.scroll(-1, 0)
+            self._graph.fill("black", (width - 1, 0, 1, self.GRAPH_H))
+            bottom = self.GRAPH_H
+            for seconds, color in zip(row, self.COLORS):
+                height = seconds * 1000 * self.GRAPH_H / HITCH_MS
+                if height >= 0.5:
+                    pygame.draw.line(self._graph, color, (width - 1, bottom - 1), (width - 1, bottom - height))
+                bottom -= height
+        self._graphed = self.frames
+        pygame.draw.line(self._graph, "yellow", (0, self.GRAPH_H - self.GRAPH_H * 1000 / 60 / HITCH_MS),
+                         (width, self.GRAPH_H - self.GRAPH_H * 1000 / 60 / HITCH_MS))
+
+        times, counters = self.recent()
+        totals = times.sum(axis=1) * 1000 if len(times) else np.zeros(1)
+        means = times.mean(axis=0) * 1000 if len(times) else np.zeros(len(self.PHASES))
+        lines = [f"frame {totals.mean():.1f} ms avg, {np.percentile(totals, 99):.1f} p99, {totals.max():.1f} max",
+                 "  ".join(f"{phase} {mean:.2f}" for phase, mean in zip(self.PHASES, means)),
+                 "  ".join(f"{counter} {count}" for counter, count in zip(self.COUNTERS, self._current_counters))]
+        left, top = 10, 10
+        texts = [self._font.render(line, True, "white", "black") for line in lines]
+        rect = pygame.Rect(left, top, max([width] + [text.get_width() for text in texts]),
+                           self.GRAPH_H + sum(text.get_height() for text in texts))
+        screen.fill("black", rect)
+        screen.blit(self._graph, (left, top))
+        top += self.GRAPH_H
+        for text in texts:
+            screen.blit(text, (left, top))
+            top += text.get_height()
+        return rect
+
+
+class FixedTimestep:
+    # Runs the simulation at a fixed rate under a render loop of any rate. advance(seconds) adds the wall time of a
+    # frame and returns the steps of dt due for it, at most max_steps: the time past that is dropped, so a hitch
+    # slows the game down for a moment instead of making every next frame late too. alpha is the part of a step
+    # the wall clock is past the last step, the renderer blends the last two states with it.
+
+    def __init__(self, dt: float = TICK, max_steps: int = MAX_CATCH_UP):
+        self.dt = dt
+        self.max_steps = max_steps
+        self.accumulator = 0.0  # wall time not simulated yet, under dt after advance()
+        self.dropped = 0  # steps dropped by the last advance()
+
+    def advance(self, seconds: float) -> int:
+        self.accumulator += seconds
+        steps = int(self.accumulator / self.dt + 1e-9)
+        self.dropped = max(steps - self.max_steps, 0)
+        self.accumulator = max(self.accumulator - steps * self.dt, 0.0)
+        return steps - self.dropped
+
+    @property
+    def alpha(self) -> float:
+        return min(self.accumulator / self.dt, 1.0)
+
+
+class Inputs(NamedTuple):
+    left: bool = False
+    right: bool = False
+    up: bool = False
+    down: bool = False
+    throw: bool = False  # only on the step the throw key was pressed
+
+    def bits(self) -> int:
+        return sum(1 << bit for bit, pressed in enumerate(self) if pressed)
+
+    @classmethod
+    def from_bits(cls, bits: int) -> "Inputs":
+        return cls(*(bool(bits >> bit & 1) for bit in range(len(cls._fields))))
+
+
+class Recording:
+    # Inputs of a play session, enough to replay it exactly: the seed and the level, then the inputs and dt given to
+    # every Simulation.step, and every CHECK_EVERY frames the Simulation.checksum() after the step. Little endian:
+    #   header  magic "PZRC", version u16, has seed u8, seed i64, level crc32 u32, level path length u16, path utf-8
+    #   body    zlib stream of frames: flags u8 (the inputs as bits, then CHECKSUM and NEW_DT), dt index u8 in the
+    #           table of the dt values seen so far, then dt f64 when NEW_DT is set and the checksum u32 when CHECKSUM
+    #           is set. A new dt gets the next index of the table, 255 once the table is full.
+    # Recorder writes them, Recording reads them.
+    MAGIC = b"PZRC"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHBqIH")
+    FRAME = struct.Struct("<BB")
+    DT = struct.Struct("<d")
+    CHECK = struct.Struct("<I")
+    CHECKSUM, NEW_DT = 1 << 5, 1 << 6
+    CHECK_EVERY = 60
+
+    def __init__(self, path: str):
+        with open(path, "rb") as file:
+            data = file.read()
+        magic, version, has_seed, seed, self.level_crc, length = self.HEADER.unpack_from(data, 0)
+        if magic != self.MAGIC:
+            raise ValueError("not a recording")
+        if version != self.VERSION:
+            raise ValueError(f"recording format version {version} is not supported (expected {self.VERSION})")
+        self.seed = seed if has_seed else None
+        self.level_path = data[self.HEADER.size:self.HEADER.size + length].decode()  # "" for the default level
+        self.body = zlib.decompress(data[self.HEADER.size + length:])
+
+    def frames(self):
+        # yields (inputs, dt, checksum or None) for every frame
+        body, table, offset = self.body, [], 0
+        while offset < len(body):
+            flags, index = self.FRAME.unpack_from(body, offset)
+            offset += self.FRAME.size
+            if flags & self.NEW_DT:
+                dt, = self.DT.unpack_from(body, offset)
+                offset += self.DT.size
+                if index < 255:
+                    table.append(dt)
+            else:
+                dt = table[index]
+            checksum = None
+            if flags & self.CHECKSUM:
+                checksum, = self.CHECK.unpack_from(body, offset)
+                offset += self.CHECK.size
+            yield Inputs.from_bits(flags), dt, checksum
+
+
+class Recorder:
+    # Writes a Recording of the steps of a Simulation, call record() after every step
+
+    def __init__(self, path: str, sim: "Simulation", level_path: str = None):
+        self.sim = sim
+        self.file = open(path, "wb")
+        level_path = (level_path or "").encode()
+        seed = sim.world.seed
+        self.file.write(Recording.HEADER.pack(Recording.MAGIC, Recording.VERSION, seed is not None, seed or 0,
+                                              zlib.crc32(sim.level.buffer), len(level_path)) + level_path)
+        self.compressor = zlib.compressobj()
+        self.dts = {}  # dt -> index in the table
+        self.frames = 0
+
+    def record(self, inputs: Inputs, dt: float):
+        flags = inputs.bits()
+        index = self.dts.get(dt)
+        extra = b""
+        if index is None:
+            index = min(len(self.dts), 255)
+            if index < 255:
+                self.dts[dt] = index
+            flags |= Recording.NEW_DT
+            extra = Recording.DT.pack(dt)
+        self.frames += 1
+        if self.frames % Recording.CHECK_EVERY == 0:
+            flags |= Recording.CHECKSUM
+            extra += Recording.CHECK.pack(self.sim.checksum())
+        self.file.write(self.compressor.compress(Recording.FRAME.pack(flags, index) + extra))
+
+    def close(self):
+        self.file.write(self.compressor.flush())
+        self.file.close()
+
+
+class Snapshot(NamedTuple):
+    # Whole state of a Simulation, taken by Simulation.snapshot(). state packs the player and the live slots of the
+    # pools, chunks are the TileMap.share() entries, shared with the other snapshots taken while they did not change,
+    # generated and saved are copies of the ones of the WorldStreamer (the saved chunks are immutable bytes).
+    state: bytes
+    chunks: dict
+    generated: dict
+    saved: dict
+
+
+class Simulation:
+    # The game rules and physics, without any window, event or wall clock dependency. Advance it with step().
+    # snapshot() and restore() save and rewind the whole state, snapshots only go back into the Simulation that took
+    # them.
+    PLAYER = struct.Struct("<ddddddBBBBB")  # the player fields, see pack_player()
+    CLOCK = struct.Struct("<dI")  # ticks, resets
+
+    def __init__(self, seed: int = 0, level: Level = None):
+        self.ticks = 0  # simulation clock in milliseconds, advanced by step()
         self.player_position = [W_BLOCKS // 2, H_BLOCKS - 3]
         self.player_velocity = PLAYER_VELOCITY.get("normal")
         self.player_crouch = False
@@ -65,28 +1181,70 @@ class Game:
         self.player_direction = Direction.FRONT
         self.player_jump_height = PLAYER_JUMP_H.get("normal")
         self.player_jump_velocity = 0
+        self.player_move = 0  # horizontal move asked by the inputs of this step, in tiles
         self.pizza_velocity = 20
         self.pizza_lifetime = 1000  # milliseconds
-        self.pizza_objects = []
+        self.pizzas = ProjectilePool()
+        self.enemies = EnemyPool()
+        self.enemy_grid = SpatialHash()
         self.GRAVITY = 25
-        self.map = Maps(self)
+        self.resets = 0  # number of reset() calls, lets renderers notice the world was rebuilt
+        self.profiler = None  # FrameProfiler the phases of step() are charged to
+        self._nav = None
+        self.tiles = TileMap()
+        self.collider = Collider(self.tiles)
+        self.mover = BoxMover(self.collider.column_masks)
+        self.level = level if level is not None else default_level()
+        self.world = WorldStreamer(self.tiles, self.level, seed, self.enemies)
         self.reset()
 
-    def handle_keys(self, dt):
+    @property
+    def nav(self):
+        # navigation.NavGraph of the loaded chunks, it follows the change journal of the tiles while it is set here
+        return self._nav
+
+    @nav.setter
+    def nav(self, nav):
+        if self._nav is not None and self._nav is not nav:
+            self._nav.close()
+        if nav is not None:
+            nav.open()
+        self._nav = nav
+
+    def step(self, inputs: Inputs, dt: float = TICK):
+        profiler = self.profiler
+        self.world.update(self.player_position[0])
+        self.apply_game_rules()
+        if profiler:
+            profiler.lap("world")
+        self.handle_inputs(inputs, dt)
+        self.update_player_position(dt)
+        if profiler:
+            profiler.lap("player")
+        self.update_pizzas_position(dt)
+        if profiler:
+            profiler.lap("pizzas")
+        self.update_enemies(dt)
+        if profiler:
+            profiler.lap("enemies")
+        self.ticks += dt * 1000
+        self.tiles.commit()
+        if profiler:
+            profiler.lap("world")
+
+    def handle_inputs(self, inputs: Inputs, dt):
         self.player_direction = Direction.FRONT
 
-        keys = pygame.key.get_pressed()
-        if not self.player_stuck[2] and (keys[pygame.K_w] or keys[pygame.K_UP]):
+        if not self.player_stuck[2] and inputs.up:
             self.jump()
-        if keys[pygame.K_a] or keys[pygame.K_LEFT]:
-            if not self.player_stuck[0]:
-                self.player_position[0] -= dt * self.player_velocity
+        self.player_move = 0
+        if inputs.left:
+            self.player_move -= dt * self.player_velocity
             self.player_direction = Direction.LEFT
-        if keys[pygame.K_d] or keys[pygame.K_RIGHT]:
-            if not self.player_stuck[1]:
-                self.player_position[0] += dt * self.player_velocity
+        if inputs.right:
+            self.player_move += dt * self.player_velocity
             self.player_direction = Direction.RIGHT
-        if keys[pygame.K_s] or keys[pygame.K_DOWN] or (self.player_crouch and self.player_stuck[2]):
+        if inputs.down or (self.player_crouch and self.player_stuck[2]):
             self.player_crouch = True
             self.player_velocity = PLAYER_VELOCITY.get("crouch")
             self.player_jump_height = PLAYER_JUMP_H.get("crouch")
@@ -95,64 +1253,401 @@ class Game:
             self.player_velocity = PLAYER_VELOCITY.get("normal")
             self.player_jump_height = PLAYER_JUMP_H.get("normal")
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                self.running = False
+        if inputs.throw:
+            self._throw_pizza()
 
-            elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
-                self._throw_pizza()
+    def jump(self):
+        if self.collider.touching(*self._player_box())[3]:  # standing on a block
+            self.player_jump_velocity = - (2 * self.GRAVITY * self.player_jump_height) ** 0.5
 
-        self.player_position[0] = round(self.player_position[0], 1)
+    def update_pizzas_position(self, dt):
+        self.pizzas.expire(self.ticks)
+        distance = dt * self.pizza_velocity
+        self.pizzas.move(distance)
+        self._update_pizza_collision(distance)
+
+    def _update_pizza_collision(self, distance: float):
+        for (x, y) in self.pizzas.collide(self.collider, self.pizza_lifetime, distance):
+            self._break_breakable(x, y)
+
+    def _break_breakable(self, x, y):
+        self.tiles.delete(x, y)
+
+    def pack_player(self) -> bytes:
+        return self.PLAYER.pack(*self.player_position, self.player_velocity, self.player_jump_height,
+                                self.player_jump_velocity, self.player_move, self.player_crouch, *self.player_stuck,
+                                self.player_direction.value)
+
+    def unpack_player(self, data, offset: int = 0):
+        values = self.PLAYER.unpack_from(data, offset)
+        self.player_position = list(values[0:2])
+        self.player_velocity, self.player_jump_height, self.player_jump_velocity, self.player_move = values[2:6]
+        self.player_crouch = bool(values[6])
+        self.player_stuck = [bool(stuck) for stuck in values[7:10]]
+        self.player_direction = Direction(values[10])
+
+    def snapshot(self) -> Snapshot:
+        state = [self.pack_player(), self.CLOCK.pack(self.ticks, self.resets), self.pizzas.pack(), self.enemies.pack()]
+        return Snapshot(b"".join(state), self.tiles.share(), dict(self.world.generated), dict(self.world.saved))
+
+    def restore(self, snapshot: Snapshot):
+        self.unpack_player(snapshot.state)
+        self.ticks, self.resets = self.CLOCK.unpack_from(snapshot.state, self.PLAYER.size)
+        offset = self.pizzas.unpack(snapshot.state, self.PLAYER.size + self.CLOCK.size)
+        self.enemies.unpack(snapshot.state, offset)
+        self.tiles.restore(snapshot.chunks)
+        self.world.generated = dict(snapshot.generated)
+        self.world.saved = dict(snapshot.saved)
+        self.tiles.commit()
+
+    def checksum(self) -> int:
+        # CRC32 of the whole game state, recordings keep it to notice a replay going a different way
+        crc = zlib.crc32(struct.pack("<dddd?BI", *self.player_position, self.player_jump_velocity, self.ticks,
+                                     self.player_crouch, self.player_direction.value, self.resets))
+        for pool, arrays in ((self.pizzas, ("x", "y", "direction", "expiry", "kind")),
+                             (self.enemies, ("x", "y", "direction", "jump_velocity", "state"))):
+            live = pool.live()
+            for name in arrays:
+                crc = zlib.crc32(getattr(pool, name)[live].tobytes(), crc)
+        for index in sorted(self.tiles.chunks):
+            crc = zlib.crc32(struct.pack("<i", index), crc)
+            crc = zlib.crc32(self.tiles.chunks[index], crc)
+        return crc
+
+    def update_enemies(self, dt):
+        # only the enemies over loaded chunks move, the streamer keeps STREAM_MARGIN chunks past the screen loaded
+        slots = self.enemies.live()
+        near = np.abs(self.enemies.x[slots] - self.player_position[0]) < W_BLOCKS // 2 + STREAM_MARGIN * CHUNK_W
+        active = slots[near]
+        if not len(active):
+            return
+        self.enemies.think(active, self.player_position)
+        self.enemies.move(active, self.mover, self.GRAVITY, dt)
+        fallen = self.enemies.y[active] > H_BLOCKS + 1
+        self.enemies.kill(active[fallen])
+        self._update_enemy_hits(active[~fallen])
+
+    def _update_enemy_hits(self, slots: np.ndarray):
+        # a pizza ends the enemies it touches, an enemy touching the player restarts the game
+        self.enemy_grid.build(slots, *self.enemies.boxes(slots))
+
+        pizzas = self.pizzas.live()
+        hit_pizzas, hit_enemies = self.enemy_grid.overlaps(self.pizzas.x[pizzas], self.pizzas.y[pizzas], 1, 1) \
+            if len(pizzas) else ((), ())
+        if len(hit_enemies):
+            self.enemies.kill(np.unique(hit_enemies))
+            self.pizzas.expiry[pizzas[np.unique(hit_pizzas)]] -= self.pizza_lifetime
+
+        self._update_player_hits()
+
+    def _update_player_hits(self):
+        left, top, width, height = self._player_box()
+        _, hit_enemies = self.enemy_grid.overlaps(np.array([left]), np.array([top]), width, height)
+        if len(hit_enemies):
+            self.reset()
 
-    def init_floor(self):
-        extra_floor = 5
-        y_floor = H_BLOCKS - 1
-        left_border_x = self.player_position[0] - W_BLOCKS // 2 - extra_floor
+    def _player_box(self) -> tuple[float, float, int, int]:
+        # (left, top, width, height) in tiles, the feet are on the row player_position[1]
+        height = 1 if self.player_crouch else 2
+        return self.player_position[0], self.player_position[1] + 1 - height, 1, height
 
-        for i in range(W_BLOCKS + 2 * extra_floor):
-            Part(left_border_x + i, y_floor, PT.BRICK)
-            Part(left_border_x + i, y_floor - 1, PT.BRICK)
+    def update_player_position(self, dt):
+        # walk then fall, each move is swept against the blocks and stops at the first one it touches
+        _, _, width, height = self._player_box()
+        x, y = self.player_position
+        self.player_position[0], self.player_position[1], self.player_jump_velocity = self.mover.move(
+            x, y, width, height, self.player_move, self.player_jump_velocity, self.GRAVITY, dt)
+        self.player_stuck = list(self.collider.touching(*self._player_box())[:3])
 
-    def draw_parts(self):
+    def reset(self):
+        self.reset_player()
+        self.enemies.clear()
+        self.tiles.clear()
+        self.resets += 1
+        self.world.reset()
+        self.world.update(self.player_position[0])
+
+    def reset_player(self):
+        self.player_position = list(self.level.start)
+        self.player_velocity = PLAYER_VELOCITY.get("normal")
+        self.player_crouch = False
+        self.player_stuck = [False, False, False]  # [from_left, from_right, from_top]
+        self.player_direction = Direction.FRONT
+        self.player_jump_height = PLAYER_JUMP_H.get("normal")
+        self.player_jump_velocity = 0
+        self.player_move = 0
+
+    def apply_game_rules(self):
+
+        if self.player_position[1] > H_BLOCKS + 1:
+            self.reset()
+
+    def _throw_pizza(self) -> int:
+        # the pizza pool slot of the thrown pizza, -1 when none was thrown
+        if not self.player_direction == Direction.FRONT:
+
+            padding = 1  # throws the pizza one block away from the player
+            if self.player_direction == Direction.LEFT:
+                padding *= -1
+
+            if not self.player_crouch:
+                return self.pizzas.spawn(self.player_position[0] + padding, math.floor(self.player_position[1] - 1),
+                                         self.player_direction, self.ticks + self.pizza_lifetime, PT.PIZZA)
+            else:
+                return self.pizzas.spawn(self.player_position[0] + padding, math.floor(self.player_position[1]),
+                                         self.player_direction, self.ticks + self.pizza_lifetime, PT.MINI_PIZZA)
+        return -1
 
-        left_border_x = math.floor(self.player_position[0] - W_BLOCKS // 2)
 
-        xy_part_map = [(left_border_x + i, y) for i in range(W_BLOCKS + 1) for y in range(0, H_BLOCKS + 1) if
-                       all_parts.get((left_border_x + i, y)) is not None]
-        for (x, y) in xy_part_map:
-            left, top = (x - left_border_x - round(self.player_position[0] % 1, 1)) * BLOCK_SIZE, y * BLOCK_SIZE
-            part = all_parts.get((math.floor(x), y))
-            if isinstance(part, Part):
-                self.draw_part(part.pt, left, top)
+class Game:
+    # Window, input and rendering on top of a Simulation
+
+    def __init__(self, width: int, height: int, level: Level = None, sim: Simulation = None, vsync: bool = False):
+        pygame.init()
+        self.running = True
+        self.screen = None
+        if vsync:
+            try:
+                self.screen = pygame.display.set_mode((width, height), pygame.SCALED, vsync=1)
+            except pygame.error as error:
+                print(f"no vsync ({error}), rendering without it", file=sys.stderr)
+        if self.screen is None:
+            self.screen = pygame.display.set_mode((width, height))
+        self.clock = pygame.time.Clock()
+        pygame.display.set_caption("Pizza Boi")
+        self.sim = sim if sim is not None else Simulation(level=level)
+        self.chunk_renderer = ChunkRenderer(self.sim.tiles, self.draw_part)
+        self._changed_tiles = []  # tiles and chunks the journal of the tiles reported since the last frame
+        self._changed_chunks = set()
+        self.sim.tiles.subscribe(self._on_changes)
+        self.atlas = SpriteAtlas(self.screen)
+        self.dirty_rendering = True  # push only the changed areas while the camera stands still
+        self.pixels_pushed = 0  # pixels sent to the display in the last frame
+        self._camera = None  # (left_border_x, offset, resets) of the last frame
+        self._sprite_rects = []  # screen areas of the sprites of the last frame
+        self.profiler = FrameProfiler()
+        self.sim.profiler = self.profiler
+        self.show_hud = False  # F3 toggles the profiler HUD, F4 dumps the profile to a file
+        self.others = []  # (x, y, direction, crouch, standing) of the other players, set by network clients
+        self.alpha = 1.0  # render() draws the positions this far from the ones keep_previous() saw to the current ones
+        self._previous = None  # positions of the player, the pizzas and the enemies before the last step
+
+    def read_inputs(self) -> Inputs:
+        throw = False
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.running = False
 
-        for pizza_part in self.pizza_objects:
-            left, top = (pizza_part.x - left_border_x - round(self.player_position[0] % 1,
-                                                              1)) * BLOCK_SIZE, pizza_part.y * BLOCK_SIZE
-            self.draw_part(pizza_part.pt, left, top)
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+                throw = True
+
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                self.show_hud = not self.show_hud
+                self._camera = None  # full frame, removes the HUD when hiding it
+
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                print("profile saved to", self.profiler.dump(), file=sys.stderr)
+
+        keys = pygame.key.get_pressed()
+        return Inputs(left=keys[pygame.K_a] or keys[pygame.K_LEFT],
+                      right=keys[pygame.K_d] or keys[pygame.K_RIGHT],
+                      up=keys[pygame.K_w] or keys[pygame.K_UP],
+                      down=keys[pygame.K_s] or keys[pygame.K_DOWN],
+                      throw=throw)
+
+    def keep_previous(self):
+        # call it before every step, render() blends the positions of the last two steps by alpha
+        sim = self.sim
+        self._previous = {"player": tuple(sim.player_position),
+                          "pizzas": (sim.pizzas.x[:sim.pizzas.end].copy(), sim.pizzas.y[:sim.pizzas.end].copy()),
+                          "enemies": (sim.enemies.x[:sim.enemies.end].copy(), sim.enemies.y[:sim.enemies.end].copy())}
+
+    def player_view(self) -> tuple[float, float]:
+        # where the player is drawn
+        x, y = self.sim.player_position
+        if self._previous is None or self.alpha >= 1:
+            return x, y
+        previous_x, previous_y = self._previous["player"]
+        if abs(x - previous_x) > TELEPORT or abs(y - previous_y) > TELEPORT:
+            return x, y
+        return previous_x + (x - previous_x) * self.alpha, previous_y + (y - previous_y) * self.alpha
+
+    def _pool_view(self, name: str) -> tuple[np.ndarray, np.ndarray]:
+        # where the live entities of the pool name are drawn
+        pool = getattr(self.sim, name)
+        slots = pool.live()
+        xs, ys = pool.x[slots], pool.y[slots]
+        if self._previous is None or self.alpha >= 1:
+            return xs, ys
+        previous_xs, previous_ys = self._previous[name]
+        known = slots < len(previous_xs)  # the slots past the previous end were taken by the last step
+        slots = np.where(known, slots, 0)
+        previous_xs = np.where(known, previous_xs[slots] if len(previous_xs) else xs, xs)
+        previous_ys = np.where(known, previous_ys[slots] if len(previous_ys) else ys, ys)
+        blend = (np.abs(xs - previous_xs) <= TELEPORT) & (np.abs(ys - previous_ys) <= TELEPORT)
+        return (np.where(blend, previous_xs + (xs - previous_xs) * self.alpha, xs),
+                np.where(blend, previous_ys + (ys - previous_ys) * self.alpha, ys))
+
+    def _camera_view(self) -> tuple[int, float]:
+        # first visible column and the fraction of it scrolled out of the screen
+        x = self.player_view()[0]
+        return math.floor(x - W_BLOCKS // 2), round(x % 1, 1)
+
+    def render(self):
+        self.atlas.validate()
+        left_border_x, offset = self._camera_view()
+        changes, chunks = self._changed_tiles, self._changed_chunks
+        self._changed_tiles, self._changed_chunks = [], set()
+
+        # the terrain under the sprites of the last frame and under the changed tiles has to be drawn again
+        camera = (left_border_x, offset, self.sim.resets)
+        dirty = None
+        # overlapping sprites merge, but not that many
+        if self.dirty_rendering and self._camera == camera and len(self._sprite_rects) <= 4 * DIRTY_MAX_RECTS:
+            screen_rect = self.screen.get_rect()
+            dirty = self._sprite_rects + [pygame.Rect(round((x - left_border_x - offset) * BLOCK_SIZE),
+                                                      y * BLOCK_SIZE, BLOCK_SIZE, BLOCK_SIZE) for (x, y) in changes]
+            dirty += [pygame.Rect(round((index * CHUNK_W - left_border_x - offset) * BLOCK_SIZE), 0,
+                                  CHUNK_W * BLOCK_SIZE, CHUNK_H * BLOCK_SIZE) for index in chunks]
+            dirty = self._merge([rect.clip(screen_rect) for rect in dirty], DIRTY_MAX_RECTS)
+
+        # full frame fallback, the camera moved (or the world was reset) so every pixel changes anyway, or so much
+        # of the screen is dirty that drawing it whole is cheaper
+        if dirty is None or sum(rect.w * rect.h for rect in dirty) > DIRTY_MAX_AREA * WIDTH * HEIGHT:
+            self._camera = camera
+            self.screen.fill(PART_COLOR.get("background"))
+            self._sprite_rects = self.draw_parts() + [self.draw_player()] + self._draw_hud()
+            pygame.display.flip()
+            self.pixels_pushed = WIDTH * HEIGHT
+            self._count_frame()
+            return
+
+        for rect in dirty:
+            self.screen.fill(PART_COLOR.get("background"), rect)
+            self.chunk_renderer.draw_area(self.screen, rect, left_border_x, offset)
+
+        self._sprite_rects = self._draw_sprites(left_border_x, offset) + [self.draw_player()] + self._draw_hud()
+        dirty = [rect for rect in dirty + self._sprite_rects if rect.w and rect.h]
+        pygame.display.update(dirty)
+        self.pixels_pushed = sum(rect.w * rect.h for rect in dirty)
+        self._count_frame()
 
-    def draw_part(self, pt: PT, left, top):
+    @staticmethod
+    def _merge(rects: list, limit: int) -> list:
+        # the non empty rects, the overlapping ones merged into their union, None once that takes more than limit
+        # rects
+        merged = []
+        for rect in sorted((rect for rect in rects if rect.w and rect.h), key=lambda rect: rect.x):
+            i = rect.collidelist(merged)
+            while i >= 0:
+                rect = rect.union(merged.pop(i))
+                i = rect.collidelist(merged)
+            merged.append(rect)
+            if len(merged) > limit:
+                return None
+        return merged
+
+    def _on_changes(self, tiles: list, chunks: set):
+        self._changed_tiles += tiles
+        self._changed_chunks |= chunks
+
+    def _draw_hud(self) -> list:
+        return [self.profiler.draw(self.screen)] if self.show_hud else []
+
+    def _count_frame(self):
+        profiler, renderer = self.profiler, self.chunk_renderer
+        profiler.count("pizzas", len(self.sim.pizzas))
+        profiler.count("enemies", len(self.sim.enemies))
+        profiler.count("chunks", len(self.sim.tiles.chunks))
+        profiler.count("chunk_redraws", renderer.redrawn)
+        profiler.count("tiles_drawn", renderer.tiles_drawn)
+        profiler.count("blits", renderer.blits + len(self._sprite_rects))
+        profiler.count("sprites", len(self._sprite_rects))
+        profiler.count("pixels", self.pixels_pushed)
+        renderer.redrawn = renderer.tiles_drawn = renderer.blits = 0
+
+    def draw_parts(self) -> list:
+        left_border_x, offset = self._camera_view()
+
+        self.chunk_renderer.draw(self.screen, left_border_x, offset)
+        return self._draw_sprites(left_border_x, offset)
+
+    def _draw_sprites(self, left_border_x: int, offset: float) -> list:
+        return self._draw_pizzas(left_border_x, offset) + self._draw_enemies(left_border_x, offset) + \
+            self._draw_others(left_border_x, offset)
+
+    def _draw_others(self, left_border_x: int, offset: float) -> list:
+        rects = []
+        for x, y, *pose in self.others:
+            if left_border_x - 2 < x < left_border_x + W_BLOCKS + 2:
+                left, top = (x - left_border_x - offset) * BLOCK_SIZE, y * BLOCK_SIZE
+                rects.append(self.atlas.blit(self.screen, tuple(pose),
+                                             lambda sprite, x, y: self._draw_pose(sprite, x, y, *pose), left, top))
+        return rects
+
+    def _draw_enemies(self, left_border_x: int, offset: float) -> list:
+        rects = []
+        xs, ys = self._pool_view("enemies")
+        shown = (xs > left_border_x - 2) & (xs < left_border_x + W_BLOCKS + 2)
+        for x, y in zip(xs[shown].tolist(), ys[shown].tolist()):
+            left, top = (x - left_border_x - offset) * BLOCK_SIZE, y * BLOCK_SIZE
+            rects.append(self.draw_part(PT.ENEMY, left, top))
+        return rects
+
+    def _draw_pizzas(self, left_border_x: int, offset: float) -> list:
+        rects = []
+        pizzas = self.sim.pizzas
+        xs, ys = self._pool_view("pizzas")
+        for x, y, kind in zip(xs.tolist(), ys.tolist(), pizzas.kind[pizzas.live()].tolist()):
+            left, top = (x - left_border_x - offset) * BLOCK_SIZE, y * BLOCK_SIZE
+            rects.append(self.draw_part(PT_BY_CODE[kind], left, top))
+        return rects
+
+    def draw_part(self, pt: PT, left, top, surface: pygame.Surface = None):
+        if surface is None:
+            surface = self.screen
         if pt == PT.BRICK:
             w = h = BLOCK_SIZE - 2 * BLOCK_MARGIN
-            pygame.draw.rect(self.screen, PART_COLOR.get("brick0"), (left, top, BLOCK_SIZE, BLOCK_SIZE))
-            pygame.draw.rect(self.screen, PART_COLOR.get("brick1"), (left + BLOCK_MARGIN, top + BLOCK_MARGIN, w, h))
+            pygame.draw.rect(surface, PART_COLOR.get("brick0"), (left, top, BLOCK_SIZE, BLOCK_SIZE))
+            pygame.draw.rect(surface, PART_COLOR.get("brick1"), (left + BLOCK_MARGIN, top + BLOCK_MARGIN, w, h))
         if pt == PT.BOX:
             w = h = BLOCK_SIZE - 6 * BLOCK_MARGIN
-            pygame.draw.rect(self.screen, PART_COLOR.get("box0"), (left, top, BLOCK_SIZE, BLOCK_SIZE))
-            pygame.draw.rect(self.screen, PART_COLOR.get("box1"),
+            pygame.draw.rect(surface, PART_COLOR.get("box0"), (left, top, BLOCK_SIZE, BLOCK_SIZE))
+            pygame.draw.rect(surface, PART_COLOR.get("box1"),
                              (left + 3 * BLOCK_MARGIN, top + 3 * BLOCK_MARGIN, w, h))
 
+        if pt in (PT.PIZZA, PT.MINI_PIZZA):
+            return self.atlas.blit(surface, pt, lambda sprite, x, y: self._draw_pizza(sprite, pt, x, y), left, top)
+        if pt == PT.ENEMY:
+            return self.atlas.blit(surface, pt, self._draw_enemy, left, top)
+
+    @staticmethod
+    def _draw_pizza(surface: pygame.Surface, pt: PT, left, top):
         if pt == PT.PIZZA:
-            pygame.draw.rect(self.screen, "red",
+            pygame.draw.rect(surface, "red",
                              (left, top + 10, BLOCK_SIZE, 5))
 
         if pt == PT.MINI_PIZZA:
-            pygame.draw.rect(self.screen, "red", (left, top + 5, BLOCK_SIZE // 2, 3))
+            pygame.draw.rect(surface, "red", (left, top + 5, BLOCK_SIZE // 2, 3))
 
-    def draw_player(self):
+    @staticmethod
+    def _draw_enemy(surface: pygame.Surface, left, top):
+        pygame.draw.ellipse(surface, ENEMY_COLOR.get("body"), (left, top + 2, BLOCK_SIZE, BLOCK_SIZE - 4))
+        pygame.draw.rect(surface, ENEMY_COLOR.get("feet"), (left + 2, top + BLOCK_SIZE - 4, 6, 4))
+        pygame.draw.rect(surface, ENEMY_COLOR.get("feet"), (left + BLOCK_SIZE - 8, top + BLOCK_SIZE - 4, 6, 4))
+        pygame.draw.rect(surface, ENEMY_COLOR.get("eyes"), (left + 5, top + 6, 3, 4))
+        pygame.draw.rect(surface, ENEMY_COLOR.get("eyes"), (left + BLOCK_SIZE - 8, top + 6, 3, 4))
+
+    def draw_player(self) -> pygame.Rect:
+        left, top = (W_BLOCKS // 2) * BLOCK_SIZE, self.player_view()[1] * BLOCK_SIZE
+        pose = (self.sim.player_direction, self.sim.player_crouch, self.sim.player_jump_velocity == 0)
+        return self.atlas.blit(self.screen, pose, lambda sprite, x, y: self._draw_pose(sprite, x, y, *pose), left, top)
+
+    @staticmethod
+    def _draw_pose(surface: pygame.Surface, left, top, direction: Direction, crouch: bool, standing: bool):
         size = BLOCK_SIZE
-        left, top = (W_BLOCKS // 2) * BLOCK_SIZE, self.player_position[1] * BLOCK_SIZE
 
-        if self.player_crouch:
+        if crouch:
             size = BLOCK_SIZE // 2
             left += size // 2
 
@@ -164,345 +1659,233 @@ class Game:
         torso_h = 3 * (size // 5)
         head_w = 1.5 * (size // 5)
 
-        if self.player_direction == Direction.FRONT:
+        if direction == Direction.FRONT:
             # legs
-            pygame.draw.rect(self.screen, PLAYER_COLOR.get("pants"),
+            pygame.draw.rect(surface, PLAYER_COLOR.get("pants"),
                              (left + leg_w, (bottom - size) + (size - leg_h), leg_w, leg_h))
-            pygame.draw.rect(self.screen, PLAYER_COLOR.get("pants"),
+            pygame.draw.rect(surface, PLAYER_COLOR.get("pants"),
                              (left + 3 * leg_w, (bottom - size) + (size - leg_h), leg_w, leg_h))
 
             # shoes
-            pygame.draw.rect(self.screen, PLAYER_COLOR.get("shoes"),
+            pygame.draw.rect(surface, PLAYER_COLOR.get("shoes"),
                              (left + leg_w, (bottom - size) + (size - shoes_h), leg_w, shoes_h))
-            pygame.draw.rect(self.screen, PLAYER_COLOR.get("shoes"),
+            pygame.draw.rect(surface, PLAYER_COLOR.get("shoes"),
                              (left + 3 * leg_w, (bottom - size) + (size - shoes_h), leg_w, shoes_h))
 
             # belt
-            pygame.draw.rect(self.screen, PLAYER_COLOR.get("belt"),
+            pygame.draw.rect(surface, PLAYER_COLOR.get("belt"),
                              (left + leg_w, (bottom - size), torso_w, (size - leg_h)))
-            pygame.draw.rect(self.screen, PLAYER_COLOR.get("pants"), (left + leg_w, (bottom - size) + 2, torso_w, 5))
+            pygame.draw.rect(surface, PLAYER_COLOR.get("pants"), (left + leg_w, (bottom - size) + 2, torso_w, 5))
 
             # torso
             shoulder_height = (bottom - size) - size + (size - torso_h)
-            pygame.draw.rect(self.screen, PLAYER_COLOR.get("shirt"),
+            pygame.draw.rect(surface, PLAYER_COLOR.get("shirt"),
                              (left + size // 5, shoulder_height, torso_w, torso_h))
 
             # head
-            pygame.draw.rect(self.screen, PLAYER_COLOR.get("head"),
+            pygame.draw.rect(surface, PLAYER_COLOR.get("head"),
                              (left + size // 2 - head_w / 2, (bottom - size) - size, head_w, (size - torso_h)))
 
             # hands
-            if self.player_jump_velocity == 0:
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("skin"), (left, shoulder_height, leg_w, leg_h))
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("shirt"), (left, shoulder_height, leg_w, 5))
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("skin"),
+            if standing:
+                pygame.draw.rect(surface, PLAYER_COLOR.get("skin"), (left, shoulder_height, leg_w, leg_h))
+                pygame.draw.rect(surface, PLAYER_COLOR.get("shirt"), (left, shoulder_height, leg_w, 5))
+                pygame.draw.rect(surface, PLAYER_COLOR.get("skin"),
                                  (left + 4 * leg_w, shoulder_height, leg_w, leg_h))
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("shirt"), (left + 4 * leg_w, shoulder_height, leg_w, 5))
+                pygame.draw.rect(surface, PLAYER_COLOR.get("shirt"), (left + 4 * leg_w, shoulder_height, leg_w, 5))
             else:
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("skin"),
+                pygame.draw.rect(surface, PLAYER_COLOR.get("skin"),
                                  (left, shoulder_height - leg_h + 5, leg_w, leg_h))
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("shirt"), (left, shoulder_height, leg_w, 5))
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("skin"),
+                pygame.draw.rect(surface, PLAYER_COLOR.get("shirt"), (left, shoulder_height, leg_w, 5))
+                pygame.draw.rect(surface, PLAYER_COLOR.get("skin"),
                                  (left + 4 * leg_w, shoulder_height - leg_h + 5, leg_w, leg_h))
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("shirt"), (left + 4 * leg_w, shoulder_height, leg_w, 5))
+                pygame.draw.rect(surface, PLAYER_COLOR.get("shirt"), (left + 4 * leg_w, shoulder_height, leg_w, 5))
         else:
             # legs
-            pygame.draw.rect(self.screen, PLAYER_COLOR.get("pants"),
+            pygame.draw.rect(surface, PLAYER_COLOR.get("pants"),
                              (left + 2 * leg_w, (bottom - size) + (size - leg_h), leg_w, leg_h))
 
             # belt
-            pygame.draw.rect(self.screen, PLAYER_COLOR.get("belt"),
+            pygame.draw.rect(surface, PLAYER_COLOR.get("belt"),
                              (left + 2 * leg_w, (bottom - size), leg_w, (size - leg_h)))
-            pygame.draw.rect(self.screen, PLAYER_COLOR.get("pants"), (left + 2 * leg_w, (bottom - size) + 2, leg_w, 5))
+            pygame.draw.rect(surface, PLAYER_COLOR.get("pants"), (left + 2 * leg_w, (bottom - size) + 2, leg_w, 5))
 
             # torso
             shoulder_height = (bottom - size) - size + (size - torso_h)
-            pygame.draw.rect(self.screen, PLAYER_COLOR.get("shirt"),
+            pygame.draw.rect(surface, PLAYER_COLOR.get("shirt"),
                              (left + 2 * leg_w, shoulder_height, leg_w, torso_h))
 
             # hands
-            if self.player_jump_velocity == 0:
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("skin"),
+            if standing:
+                pygame.draw.rect(surface, PLAYER_COLOR.get("skin"),
                                  (left + 2 * leg_w, shoulder_height, leg_w, leg_h))
             else:
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("skin"),
+                pygame.draw.rect(surface, PLAYER_COLOR.get("skin"),
                                  (left + 2 * leg_w, shoulder_height - leg_h + 5, leg_w, leg_h))
 
-            if self.player_direction == Direction.RIGHT:
+            if direction == Direction.RIGHT:
                 # shoes
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("shoes"),
+                pygame.draw.rect(surface, PLAYER_COLOR.get("shoes"),
                                  (left + 2 * leg_w, (bottom - size) + (size - shoes_h), leg_w + 2, shoes_h))
 
                 # head
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("head"),
+                pygame.draw.rect(surface, PLAYER_COLOR.get("head"),
                                  (left + 2 * leg_w, (bottom - size) - size, head_w, (size - torso_h)))
 
-            else:  # self.player_direction == Direction.LEFT
+            else:  # direction == Direction.LEFT
                 # shoes
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("shoes"),
+                pygame.draw.rect(surface, PLAYER_COLOR.get("shoes"),
                                  (left + 2 * leg_w - 2, (bottom - size) + (size - shoes_h), leg_w + 2, shoes_h))
 
                 # head
-                pygame.draw.rect(self.screen, PLAYER_COLOR.get("head"),
+                pygame.draw.rect(surface, PLAYER_COLOR.get("head"),
                                  (
                                      left + 2 * leg_w - (head_w - leg_w), (bottom - size) - size, head_w,
                                      (size - torso_h)))
 
-    def jump(self):
-        part_below_1 = all_parts.get((math.floor(self.player_position[0]), self.player_position[1] + 1))
-        part_below_2 = all_parts.get((math.ceil(self.player_position[0]), self.player_position[1] + 1))
-        if (isinstance(part_below_1, Part) and part_below_1.pt in BLOCK_PARTS) or \
-                (isinstance(part_below_2, Part) and part_below_2.pt in BLOCK_PARTS):
-            self.player_jump_velocity = - (2 * self.GRAVITY * self.player_jump_height) ** 0.5
-
-    def update_pizzas_position(self, dt):
-        for pizza_part in self.pizza_objects:
-
-            if pizza_part.lifetime < pygame.time.get_ticks():
-                self.pizza_objects.remove(pizza_part)
-
-            elif pizza_part.direction == Direction.RIGHT:
-                pizza_part.x += dt * self.pizza_velocity
-            else:  # pizza_part.direction == Direction.LEFT
-                pizza_part.x -= dt * self.pizza_velocity
-
-        self._update_pizza_collision()
-
-    def _update_pizza_collision(self):
-        for pizza_part in self.pizza_objects:
-            part_from_right = all_parts.get((math.ceil(pizza_part.x), math.ceil(pizza_part.y)))
-            part_from_left = all_parts.get((math.floor(pizza_part.x), math.ceil(pizza_part.y)))
-            pizza_padding_right = (pizza_part.x + 1) * BLOCK_SIZE + 10
-            pizza_padding_left = pizza_part.x * BLOCK_SIZE + 10
-            bounder_line_right = math.ceil(pizza_part.x) * BLOCK_SIZE
-            bounder_line_left = math.floor(pizza_part.x) * BLOCK_SIZE
-
-            block_on_right = isinstance(part_from_right, Part) and part_from_right.pt in BLOCK_PARTS and \
-                             pizza_padding_right >= bounder_line_right
-            block_on_left = isinstance(part_from_left, Part) and part_from_left.pt in BLOCK_PARTS and \
-                            pizza_padding_left >= bounder_line_left
-
-            if block_on_right or block_on_left:
-                pizza_part.lifetime -= self.pizza_lifetime
-
-            if block_on_right and part_from_right.pt in BREAKABLE_BLOCKS:
-                self._break_breakable(math.ceil(pizza_part.x), math.ceil(pizza_part.y))
-
-            if block_on_left and part_from_left.pt in BREAKABLE_BLOCKS:
-                self._break_breakable(math.floor(pizza_part.x), math.ceil(pizza_part.y))
-
-    @staticmethod
-    def _break_breakable(x, y):
-        del all_parts[(x, y)]
-
-    def update_player_position(self, dt):
-        padding = 7  # in pixels
-
-        # block under the player
-        part_below_1 = all_parts.get((math.floor(self.player_position[0]), math.ceil(self.player_position[1] + 1)))
-        part_below_2 = all_parts.get((math.ceil(self.player_position[0]), math.ceil(self.player_position[1] + 1)))
-        player_padding_below = self.player_position[1] * BLOCK_SIZE + padding
-        bounder_line_below = math.ceil(self.player_position[1]) * BLOCK_SIZE
-
-        block_is_below = ((isinstance(part_below_1, Part) and part_below_1.pt in BLOCK_PARTS) or
-                          (isinstance(part_below_2, Part) and part_below_2.pt in BLOCK_PARTS)) and \
-                         self.player_jump_velocity >= 0 and \
-                         player_padding_below >= bounder_line_below
-
-        if block_is_below:
-            self.player_jump_velocity = 0
-            self.player_position[1] = math.ceil(self.player_position[1])
-
-        # apply gravity
-        else:
-            self.player_position[1] += self.player_jump_velocity * dt + 0.5 * self.GRAVITY * dt ** 2
-            self.player_jump_velocity += self.GRAVITY * dt
-
-        # block besides the player.
-        part_from_right0 = all_parts.get((math.ceil(self.player_position[0]), math.ceil(self.player_position[1])))
-        part_from_left0 = all_parts.get((math.floor(self.player_position[0]), math.ceil(self.player_position[1])))
-        part_from_right1 = all_parts.get((math.ceil(self.player_position[0]), math.ceil(self.player_position[1] - 1)))
-        part_from_left1 = all_parts.get((math.floor(self.player_position[0]), math.ceil(self.player_position[1] - 1)))
-
-        player_padding_right = (self.player_position[0] + 1) * BLOCK_SIZE + 10
-        player_padding_left = (self.player_position[0]) * BLOCK_SIZE + 10
-        bounder_line_right = (math.ceil(self.player_position[0])) * BLOCK_SIZE
-        bounder_line_left = (math.floor(self.player_position[0])) * BLOCK_SIZE
-
-        block_on_right0 = isinstance(part_from_right0, Part) and part_from_right0.pt in BLOCK_PARTS and \
-                          player_padding_right >= bounder_line_right
-        block_on_left0 = isinstance(part_from_left0, Part) and part_from_left0.pt in BLOCK_PARTS and \
-                         player_padding_left >= bounder_line_left
-        block_on_right1 = isinstance(part_from_right1, Part) and part_from_right1.pt in BLOCK_PARTS and \
-                          player_padding_right >= bounder_line_right
-        block_on_left1 = isinstance(part_from_left1, Part) and part_from_left1.pt in BLOCK_PARTS and \
-                         player_padding_left >= bounder_line_left
-
-        # player crouch
-        if self.player_crouch:
-            if block_on_right0:
-                self.player_position[0] = math.floor(self.player_position[0])
-                self.player_stuck[1] = True
-
-            else:
-                self.player_stuck[1] = False
-
-            if block_on_left0:
-                self.player_position[0] = math.ceil(self.player_position[0])
-                self.player_stuck[0] = True
-
-            else:
-                self.player_stuck[0] = False
-
-        # Player don't crouch
-        if not self.player_crouch:
-
-            if block_on_right0 or block_on_right1:
-                self.player_position[0] = math.floor(self.player_position[0])
-                self.player_stuck[1] = True
-
-            else:
-                self.player_stuck[1] = False
-
-            if block_on_left0 or block_on_left1:
-                self.player_position[0] = math.ceil(self.player_position[0])
-                self.player_stuck[0] = True
-
-            else:
-                self.player_stuck[0] = False
-
-        # block above the player
-        if not self.player_crouch:
-            part_above0 = all_parts.get((math.floor(self.player_position[0]), math.floor(self.player_position[1] - 2)))
-            part_above1 = all_parts.get((math.ceil(self.player_position[0]), math.floor(self.player_position[1] - 2)))
-            above_player_padding = (self.player_position[1] - 1) * BLOCK_SIZE - padding
-            above_player_part = math.floor(self.player_position[1] - 1) * BLOCK_SIZE
-
-        else:  # self.player_crouch == True
-            part_above0 = all_parts.get((math.floor(self.player_position[0]), math.floor(self.player_position[1] - 1)))
-            part_above1 = all_parts.get((math.ceil(self.player_position[0]), math.floor(self.player_position[1] - 1)))
-            above_player_padding = (self.player_position[1]) * BLOCK_SIZE - padding
-            above_player_part = math.floor(self.player_position[1]) * BLOCK_SIZE
-
-        block_from_above = ((isinstance(part_above0, Part) and part_above0.pt in BLOCK_PARTS) or
-                            (isinstance(part_above1, Part) and part_above1.pt in BLOCK_PARTS)) and \
-                           self.player_jump_velocity <= 0 and \
-                           above_player_padding <= above_player_part
-
-        if block_from_above:
-            self.player_stuck[2] = True
-            self.player_jump_velocity = 0
-            self.player_position[1] = math.floor(self.player_position[1])
-
-            # if isinstance(part_above0, Part) and part_above0.pt in BREAKABLE_BLOCKS:
-            #     self._break_breakable(math.floor(self.player_position[0]),
-            #                           math.floor(self.player_position[1] - 1))
-            #
-            # if isinstance(part_above1, Part) and part_above1.pt in BREAKABLE_BLOCKS:
-            #     self._break_breakable(math.ceil(self.player_position[0]),
-            #                           math.floor(self.player_position[1] - 1))
-
-        else:
-            self.player_stuck[2] = False
-
-    def reset(self):
-        self.player_position = [W_BLOCKS // 2, H_BLOCKS - 3]
-        self.player_velocity = PLAYER_VELOCITY.get("normal")
-        self.player_crouch = False
-        self.player_stuck = [False, False, False]  # [from_left, from_right, from_top]
-        self.player_direction = Direction.FRONT
-        self.player_jump_height = PLAYER_JUMP_H.get("normal")
-        self.player_jump_velocity = 0
-        self.init_floor()
-        self.map.map_0()
-
-    def apply_game_rules(self):
-
-        if self.player_position[1] > H_BLOCKS + 1:
-            self.reset()
-
-    def _throw_pizza(self):
-        if not self.player_direction == Direction.FRONT:
-
-            padding = 1  # throws the pizza one block away from the player
-            if self.player_direction == Direction.LEFT:
-                padding *= -1
-
-            if not self.player_crouch:
-                self.pizza_objects.append(Part(self.player_position[0] + padding,
-                                               math.floor(self.player_position[1] - 1),
-                                               PT.PIZZA, pygame.time.get_ticks() + self.pizza_lifetime,
-                                               self.player_direction))
-            else:
-                self.pizza_objects.append(Part(self.player_position[0] + padding,
-                                               math.floor(self.player_position[1]),
-                                               PT.MINI_PIZZA, pygame.time.get_ticks() + self.pizza_lifetime,
-                                               self.player_direction))
-
 
 class Maps:
-    def __init__(self, game: Game):
-        self.maps = []
-        self.game = game
+    # Level builders write into a TileMap and return the player start position, Level.compile() turns them into
+    # level files
 
     @staticmethod
-    def _stairs_right(start_pos: tuple[int, int], pt: PT, amount: int, length: int) -> int:
+    def _stairs_right(tiles: TileMap, start_pos: tuple[int, int], pt: PT, amount: int, length: int) -> int:
         for i in range(amount):
             for j in range(i + 1):
                 for k in range(length):
-                    Part(start_pos[0] + i * length + k, start_pos[1] - j, pt)
+                    tiles.set(start_pos[0] + i * length + k, start_pos[1] - j, pt)
         return amount * length
 
     @staticmethod
-    def _stairs_left(start_pos: tuple[int, int], pt: PT, amount: int, length: int) -> int:
+    def _stairs_left(tiles: TileMap, start_pos: tuple[int, int], pt: PT, amount: int, length: int) -> int:
         start_pos0 = start_pos[0] + amount * length -1
         for i in range(amount):
             for j in range(i + 1):
                 for k in range(length):
-                    Part(start_pos0 - i * length - k, start_pos[1] - j, pt)
+                    tiles.set(start_pos0 - i * length - k, start_pos[1] - j, pt)
         return amount * length
 
     @staticmethod
-    def _hill(start_pos: tuple[int, int], pt: PT, height: int, length: int) -> int:
+    def _hill(tiles: TileMap, start_pos: tuple[int, int], pt: PT, height: int, length: int) -> int:
 
         stair_height = math.ceil(height / (2.0*length))
         stair_length = math.ceil(length / (2.0*stair_height))
-        print((stair_height, stair_length))
         x_0 = start_pos[0]
-        x_0 += Maps._stairs_right((x_0, start_pos[1]), pt, length//2, stair_length)
-        x_0 += Maps._stairs_left((x_0, start_pos[1]), pt, length//2, stair_length)
+        x_0 += Maps._stairs_right(tiles, (x_0, start_pos[1]), pt, length//2, stair_length)
+        x_0 += Maps._stairs_left(tiles, (x_0, start_pos[1]), pt, length//2, stair_length)
         return length
 
-    def map_0(self):
+    @staticmethod
+    def _hill_width(height: int, length: int) -> int:
+        # columns _hill really covers, it returns the length it was asked for
+        stair_length = math.ceil(length / (2.0 * math.ceil(height / (2.0 * length))))
+        return 2 * (length // 2) * stair_length
+
+    @staticmethod
+    def random_chunk(tiles: TileMap, index: int, rng: random.Random):
+        # fills the chunk with random hills, stairs, box walls and enemies on the flat parts, every one stays inside
+        # the chunk and can be jumped over, the floor is already there
         level_0 = H_BLOCKS - 3
-        x_0 = W_BLOCKS // 2
+        x_0 = index * CHUNK_W + rng.randint(2, 6)
+        x_end = (index + 1) * CHUNK_W
+
+        while True:
+            kind = rng.choice(("hill", "stairs", "boxes", "flat"))
+            if kind == "hill":
+                height, length = rng.randint(10, 60), rng.choice((4, 6, 8))
+                if x_0 + Maps._hill_width(height, length) > x_end:
+                    break
+                Maps._hill(tiles, (x_0, level_0), PT.BRICK, height, length)
+                x_0 += Maps._hill_width(height, length)
+            elif kind == "stairs":
+                amount, length = rng.randint(2, 4), rng.randint(1, 3)
+                if x_0 + 2 * amount * length > x_end:
+                    break
+                x_0 += Maps._stairs_right(tiles, (x_0, level_0), PT.BRICK, amount, length)
+                x_0 += Maps._stairs_left(tiles, (x_0, level_0), PT.BRICK, amount, length)
+            elif kind == "boxes":
+                width, height = rng.randint(1, 3), rng.randint(1, 2)
+                if x_0 + width > x_end:
+                    break
+                for x in range(x_0, x_0 + width):
+                    for y in range(level_0 - height + 1, level_0 + 1):
+                        tiles.set(x, y, PT.BOX)
+                x_0 += width
+            else:
+                x_0 += rng.randint(3, 8)
+                if x_0 >= x_end:
+                    break
+                if rng.random() < 0.5:
+                    tiles.set(x_0 - 1, level_0, PT.ENEMY)
+            x_0 += rng.randint(2, 5)
 
-        self.game.player_position[1] = level_0 - 2
+    @staticmethod
+    def map_0(tiles: TileMap) -> tuple[int, int]:
+        level_0 = H_BLOCKS - 3
+        x_0 = W_BLOCKS // 2
 
         for i in range(4):
-            Part(x_0 - 2 + i, level_0 - 1, PT.BOX)
-            Part(x_0 - 2 + i, level_0, PT.BOX)
-
-        self._hill((x_0 + 6, level_0), PT.BRICK, 50, 10)
-        self._hill((x_0 + 18, level_0), PT.BRICK, 60, 20)
+            tiles.set(x_0 - 2 + i, level_0 - 1, PT.BOX)
+            tiles.set(x_0 - 2 + i, level_0, PT.BOX)
 
+        Maps._hill(tiles, (x_0 + 6, level_0), PT.BRICK, 50, 10)
+        Maps._hill(tiles, (x_0 + 18, level_0), PT.BRICK, 60, 20)
+        return x_0, level_0 - 2
 
-def main():
-    game = Game(WIDTH, HEIGHT)
 
-    while game.running:
-        dt = game.clock.tick(60) / 1000
+@lru_cache(maxsize=None)
+def default_level() -> Level:
+    # map_0 compiled once per process
+    return Level(Level.compile(Maps.map_0))
 
-        game.screen.fill(PART_COLOR.get("background"))
 
-        game.init_floor()
-        game.draw_parts()
-        game.apply_game_rules()
-        game.handle_keys(dt)
-        game.update_player_position(dt)
-        game.update_pizzas_position(dt)
-        game.draw_player()
-        pygame.display.flip()
+def main():
+    # python main.py [level file] [--record session.pzrc] [--fps 60 | --vsync] [--stats frames.json]
+    parser = argparse.ArgumentParser(description="Pizza Boi")
+    parser.add_argument("level", nargs="?", help="level file made by compile_level.py")
+    parser.add_argument("--record", metavar="FILE", help="record the session, replay.py plays it back")
+    parser.add_argument("--fps", type=int, default=60, help="render rate cap, 0 renders as fast as possible")
+    parser.add_argument("--vsync", action="store_true", help="render at the refresh rate of the display")
+    parser.add_argument("--stats", metavar="FILE", help="write frame time statistics there on exit")
+    args = parser.parse_args()
+    game = Game(WIDTH, HEIGHT, Level.open(args.level) if args.level else None, vsync=args.vsync)
+    recorder = Recorder(args.record, game.sim, args.level) if args.record else None
+
+    # the simulation steps at TICK whatever the render rate, a frame runs the steps its wall time is due and draws
+    # the state in between the last two
+    profiler = game.profiler
+    timestep = FixedTimestep()
+    throw = False  # a throw pressed on a frame without a step waits for the next step
+    last = time.perf_counter()
+    try:
+        while game.running:
+            game.clock.tick(0 if args.vsync else args.fps)
+            now = time.perf_counter()
+            steps = timestep.advance(now - last)
+            last = now
+            profiler.lap("wait")
+
+            inputs = game.read_inputs()
+            throw = throw or inputs.throw
+            profiler.lap("inputs")
+            for _ in range(steps):
+                inputs, throw = inputs._replace(throw=throw), False
+                game.keep_previous()
+                game.sim.step(inputs, timestep.dt)
+                if recorder:
+                    recorder.record(inputs, timestep.dt)
+            game.alpha = timestep.alpha
+            game.render()
+            profiler.count("steps", steps)
+            profiler.count("dropped_steps", timestep.dropped)
+            profiler.lap("render")
+            profiler.end_frame()
+    finally:
+        if recorder:
+            recorder.close()
+        if args.stats:
+            with open(args.stats, "w") as file:
+                file.write(json.dumps(profiler.summary(), indent=2) + "\n")
 
 
 if __name__ == "__main__":
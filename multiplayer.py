@@ -0,0 +1,632 @@
+import argparse
+import asyncio
+import json
+import struct
+import sys
+import time
+import zlib
+from collections import deque
+
+import numpy as np
+
+from main import (CHUNK_W, H_BLOCKS, HEIGHT, PT_BY_CODE, STREAM_MARGIN, TICK, W_BLOCKS, WIDTH, Direction, EnemyPool,
+                  Game, Inputs, Level, Simulation)
+
+QUANT = 32  # positions are sent in 1/QUANT tiles
+SNAPSHOT_EVERY = 3  # ticks between the snapshots of a client, 20 per second at TICK
+MAX_SNAPSHOT_EVERY = 12  # slowest snapshot rate the budgets can push a client down to
+INTERP_TICKS = 6  # the other players and the enemies are shown this many ticks behind the last snapshot
+VIEW = W_BLOCKS  # players and enemies further than this from a client (in columns) are not sent to it
+MAX_TILES = 512  # tile changes per snapshot, a client joining a much changed world gets them over a few snapshots
+INPUT_BACKLOG = 4  # inputs queued on the server past this are dropped, the client corrects its prediction
+MAX_CATCH_UP = 5  # ticks run at once when the server falls behind, the ones past that are skipped
+BYTES_BUDGET = 8192  # bytes a second sent to a client
+CPU_BUDGET = 0.25e-3  # server seconds per tick and per client
+
+# Messages, little endian, the first byte is the type. The player fields are the Simulation.PLAYER ones.
+#   welcome   server -> client on connect: player id u8, has seed u8, seed i64, level crc32 u32
+#   input     client -> server every client tick: sequence u32, Inputs.bits() u8
+#   snapshot  server -> client: tick u32, sequence of the last input applied u32, simulation ticks (ms) f64, then
+#             the counts of the sections below u16 each, the player fields of the client, and the sections:
+#             changed tiles (x i32, y i16, PT code u8), players moved into view or changed (id u8, x i32, y i16,
+#             pose u8), players gone from view (id u8), enemies the same (slot u16, x i32, y i16) and (slot u16),
+#             pizzas thrown by the other players (owner u8, x i32, y i16, direction i8, PT code u8, ms left u16)
+# Positions are in 1/QUANT tiles. A pose is the direction value, then crouch << 2 and standing << 3.
+WELCOME, INPUT, SNAPSHOT = 1, 2, 3
+WELCOME_MESSAGE = struct.Struct("<BBBqI")
+INPUT_MESSAGE = struct.Struct("<BIB")
+SNAPSHOT_HEADER = struct.Struct("<BIIdHHHHHH")
+TILE = struct.Struct("<ihB")
+PLAYER = struct.Struct("<BihB")
+GONE_PLAYER = struct.Struct("<B")
+ENEMY = struct.Struct("<Hih")
+GONE_ENEMY = struct.Struct("<H")
+SPAWN = struct.Struct("<BihbBH")
+
+
+class LoopbackTransport:
+    # In-process stand-in for a local socket, pair() makes the two connected ends. Messages are handed over as they
+    # are, the byte counters include the length prefix a StreamTransport would add.
+
+    def __init__(self):
+        self.inbox = asyncio.Queue()
+        self.peer = None
+        self.sent = 0
+        self.received = 0
+        self.closed = False
+
+    @classmethod
+    def pair(cls) -> tuple["LoopbackTransport", "LoopbackTransport"]:
+        a, b = cls(), cls()
+        a.peer, b.peer = b, a
+        return a, b
+
+    def send(self, data: bytes):
+        if not self.closed:
+            self.sent += StreamTransport.FRAME.size + len(data)
+            self.peer.inbox.put_nowait(data)
+
+    async def recv(self) -> bytes:
+        # the next message, None once either end is closed
+        data = await self.inbox.get()
+        if data is not None:
+            self.received += StreamTransport.FRAME.size + len(data)
+        return data
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.inbox.put_nowait(None)
+            self.peer.inbox.put_nowait(None)
+
+
+class StreamTransport:
+    # The same over an asyncio stream, a TCP connection on localhost. Every message is prefixed by its length u16.
+    FRAME = struct.Struct("<H")
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.sent = 0
+        self.received = 0
+
+    def send(self, data: bytes):
+        if not self.writer.is_closing():
+            self.writer.write(self.FRAME.pack(len(data)) + data)
+            self.sent += self.FRAME.size + len(data)
+
+    async def recv(self) -> bytes:
+        try:
+            length, = self.FRAME.unpack(await self.reader.readexactly(self.FRAME.size))
+            data = await self.reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+        self.received += self.FRAME.size + length
+        return data
+
+    def close(self):
+        self.writer.close()
+
+
+def _pose(fields: tuple) -> int:
+    # pose of the unpacked Simulation.PLAYER fields
+    return fields[10] | fields[6] << 2 | (fields[4] == 0) << 3
+
+
+# pose -> (direction, crouch, standing)
+POSES = {direction.value | crouch << 2 | standing << 3: (direction, bool(crouch), bool(standing))
+         for direction in Direction for crouch in (0, 1) for standing in (0, 1)}
+
+
+class ServerSimulation(Simulation):
+    # One shared world for many players. The player fields of Simulation hold one player at a time: step() loads
+    # every player into them in turn and runs the player rules of Simulation on it, so the players follow the same
+    # rules as in single player and a client predicting its player with a Simulation gets the same results.
+    # Falling out of the world or touching an enemy respawns that player, the world itself is never reset.
+
+    def __init__(self, seed: int = 0, level: Level = None):
+        self.players = {}  # player id -> pack_player() fields
+        self.spawns = []  # (owner, pizza slot) thrown since the last take_events()
+        self.changed = []  # (x, y) of the tiles changed since the last take_events()
+        self.edits = {}  # (x, y) -> PT code of every tile the players changed, for the clients joining later
+        self._player = None  # id of the player in the fields
+        super().__init__(seed, level)
+        self.tiles.subscribe(self._on_changes)
+
+    def join(self, player: int):
+        self.reset_player()
+        self.players[player] = self.pack_player()
+
+    def leave(self, player: int):
+        self.players.pop(player, None)
+
+    def fields(self, player: int) -> tuple:
+        return self.PLAYER.unpack(self.players[player])
+
+    def step(self, inputs: dict, dt: float = TICK):
+        # inputs: player id -> Inputs, the players without any stand still
+        self.world.update(*(self.PLAYER.unpack_from(fields)[0] for fields in self.players.values()))
+        for player, fields in self.players.items():
+            self._player = player
+            self.unpack_player(fields)
+            self.handle_inputs(inputs.get(player, Inputs()), dt)
+            self.update_player_position(dt)
+            if self.player_position[1] > H_BLOCKS + 1:
+                self.reset_player()
+            self.players[player] = self.pack_player()
+        self.update_pizzas_position(dt)
+        self.update_enemies(dt)
+        self.ticks += dt * 1000
+        self.tiles.commit()
+
+    def update_enemies(self, dt):
+        # every enemy near a player thinks about the nearest one
+        slots = self.enemies.live()
+        if not len(slots) or not self.players:
+            return
+        fields = [self.PLAYER.unpack(data) for data in self.players.values()]
+        xs, ys = np.array([field[0] for field in fields]), np.array([field[1] for field in fields])
+        distance = np.abs(self.enemies.x[slots][:, None] - xs[None, :])
+        nearest = distance.argmin(axis=1)
+        near = distance[np.arange(len(slots)), nearest] < W_BLOCKS // 2 + STREAM_MARGIN * CHUNK_W
+        active = slots[near]
+        if not len(active):
+            return
+        self.enemies.think(active, (xs[nearest[near]], ys[nearest[near]]))
+        self.enemies.move(active, self.mover, self.GRAVITY, dt)
+        fallen = self.enemies.y[active] > H_BLOCKS + 1
+        self.enemies.kill(active[fallen])
+        self._update_enemy_hits(active[~fallen])
+
+    def _update_player_hits(self):
+        for player, fields in self.players.items():
+            self.unpack_player(fields)
+            left, top, width, height = self._player_box()
+            _, hit_enemies = self.enemy_grid.overlaps(np.array([left]), np.array([top]), width, height)
+            if len(hit_enemies):
+                self.reset_player()
+                self.players[player] = self.pack_player()
+
+    def _on_changes(self, tiles: list, chunks: set):
+        # the chunks loaded and evicted by the streamer are the same on every client, only the single tile changes
+        # are the players' doing
+        for x, y in tiles:
+            self.changed.append((x, y))
+            self.edits[(x, y)] = self.tiles.get(x, y).value
+
+    def _throw_pizza(self) -> int:
+        slot = super()._throw_pizza()
+        if slot >= 0:
+            self.spawns.append((self._player, slot))
+        return slot
+
+    def take_events(self) -> tuple[list, list]:
+        # (tiles changed, pizzas thrown) since the last call
+        events = self.changed, self.spawns
+        self.changed, self.spawns = [], []
+        return events
+
+
+class Connection:
+    # What the server knows about a client and what it last sent to it
+
+    def __init__(self, player: int, transport, tiles: list, tick: int):
+        self.player = player
+        self.transport = transport
+        self.inputs = deque()  # (sequence, Inputs) waiting for their tick
+        self.held = Inputs()  # last inputs applied, kept while no new ones arrive
+        self.last = 0  # sequence of the last input applied
+        self.tiles = deque(tiles)  # (x, y, PT code) not sent yet
+        self.spawns = []  # (owner, pizza slot) not sent yet
+        self.players = {}  # player id -> (x, y, pose) last sent
+        self.enemies = {}  # enemy slot -> (x, y) last sent
+        self.every = SNAPSHOT_EVERY
+        self.next = tick + player % SNAPSHOT_EVERY  # tick of the next snapshot, the clients are spread over ticks
+        self.window = deque()  # (tick, bytes) of the snapshots of the last second
+
+
+class Server:
+    # Runs a ServerSimulation at a fixed tick for the clients connected through serve(). Every tick applies the
+    # oldest queued input of every client. Every `every` ticks of a client it is sent a snapshot: its own player
+    # fields with the sequence of the last input they include, then only what changed for it since its last
+    # snapshot, the broken tiles, the players and the enemies in its view that moved and the pizzas thrown.
+    # The budgets are checked every second: a client sent more than BYTES_BUDGET bytes in the last second gets its
+    # snapshots less often, and all of them do when the ticks took more than CPU_BUDGET per client, the rates go
+    # back up once there is room again.
+
+    def __init__(self, seed: int = 0, level: Level = None, tick: float = TICK):
+        self.sim = ServerSimulation(seed, level)
+        self.seed = seed
+        self.tick_seconds = tick
+        self.tick = 0
+        self.clients = {}  # player id -> Connection
+        self.tick_times = deque(maxlen=round(1 / tick))  # seconds the last ticks took
+        self.skipped = 0  # ticks skipped because the server fell behind
+
+    async def serve(self, transport):
+        # plays one client until its transport closes
+        player = next((player for player in range(256) if player not in self.clients), None)
+        if player is None:
+            transport.close()
+            return
+        self.sim.join(player)
+        self.clients[player] = connection = Connection(
+            player, transport, [(x, y, code) for (x, y), code in self.sim.edits.items()], self.tick)
+        seed = self.sim.world.seed
+        transport.send(WELCOME_MESSAGE.pack(WELCOME, player, seed is not None, seed or 0,
+                                            zlib.crc32(self.sim.level.buffer)))
+        try:
+            while (data := await transport.recv()) is not None:
+                if data[0] == INPUT:
+                    _, sequence, bits = INPUT_MESSAGE.unpack(data)
+                    connection.inputs.append((sequence, Inputs.from_bits(bits)))
+                    while len(connection.inputs) > INPUT_BACKLOG:
+                        connection.inputs.popleft()
+        finally:
+            del self.clients[player]
+            self.sim.leave(player)
+            transport.close()
+
+    def step(self):
+        start = time.perf_counter()
+        inputs = {}
+        for player, connection in self.clients.items():
+            if connection.inputs:
+                connection.last, connection.held = connection.inputs.popleft()
+                inputs[player] = connection.held
+            else:
+                inputs[player] = connection.held._replace(throw=False)
+        self.sim.step(inputs, self.tick_seconds)
+        self.tick += 1
+
+        changed, spawns = self.sim.take_events()
+        tiles = [(x, y, self.sim.tiles.get(x, y).value) for x, y in changed]
+        players = {player: self.sim.fields(player) for player in self.clients}
+        views = {player: (round(fields[0] * QUANT), round(fields[1] * QUANT), _pose(fields))
+                 for player, fields in players.items()}
+        enemies = None
+        for connection in self.clients.values():
+            connection.tiles.extend(tiles)
+            connection.spawns.extend(spawns)
+            if self.tick >= connection.next:
+                if enemies is None:
+                    slots = self.sim.enemies.live()
+                    enemies = (slots, self.sim.enemies.x[slots], self.sim.enemies.y[slots])
+                self._send(connection, players[connection.player], views, enemies)
+                connection.next = self.tick + connection.every
+        self.tick_times.append(time.perf_counter() - start)
+        if self.tick % round(1 / self.tick_seconds) == 0:
+            self._check_budgets()
+
+    def _send(self, connection: Connection, fields: tuple, views: dict, enemies: tuple):
+        x = fields[0]
+        parts = [self.sim.PLAYER.pack(*fields)]
+
+        tiles = [connection.tiles.popleft() for _ in range(min(len(connection.tiles), MAX_TILES))]
+        parts += [TILE.pack(*tile) for tile in tiles]
+
+        seen = {player: view for player, view in views.items()
+                if player != connection.player and abs(view[0] / QUANT - x) < VIEW}
+        moved = [(player, *view) for player, view in seen.items() if connection.players.get(player) != view]
+        gone = [player for player in connection.players if player not in seen]
+        connection.players = seen
+        parts += [PLAYER.pack(*entry) for entry in moved] + [GONE_PLAYER.pack(player) for player in gone]
+
+        slots, xs, ys = enemies
+        near = np.abs(xs - x) < VIEW
+        seen = dict(zip(slots[near].tolist(), zip(np.round(xs[near] * QUANT).astype(np.int64).tolist(),
+                                                  np.round(ys[near] * QUANT).astype(np.int64).tolist())))
+        moved_enemies = [(slot, *view) for slot, view in seen.items() if connection.enemies.get(slot) != view]
+        gone_enemies = [slot for slot in connection.enemies if slot not in seen]
+        connection.enemies = seen
+        parts += [ENEMY.pack(*entry) for entry in moved_enemies] + [GONE_ENEMY.pack(slot) for slot in gone_enemies]
+
+        pizzas, spawns = self.sim.pizzas, []
+        for owner, slot in connection.spawns:
+            if owner != connection.player and pizzas.alive[slot] and abs(pizzas.x[slot] - x) < VIEW:
+                left = min(max(pizzas.expiry[slot] - self.sim.ticks, 0), 0xffff)
+                spawns.append(SPAWN.pack(owner, round(pizzas.x[slot] * QUANT), round(pizzas.y[slot] * QUANT),
+                                         int(pizzas.direction[slot]), pizzas.kind[slot], round(left)))
+        connection.spawns = []
+        parts += spawns
+
+        data = SNAPSHOT_HEADER.pack(SNAPSHOT, self.tick, connection.last, self.sim.ticks, len(tiles), len(moved),
+                                    len(gone), len(moved_enemies), len(gone_enemies), len(spawns)) + b"".join(parts)
+        connection.transport.send(data)
+        connection.window.append((self.tick, len(data) + StreamTransport.FRAME.size))
+
+    def _check_budgets(self):
+        second = round(1 / self.tick_seconds)
+        busy = self.clients and sum(self.tick_times) / len(self.tick_times) > CPU_BUDGET * len(self.clients)
+        for connection in self.clients.values():
+            while connection.window and connection.window[0][0] <= self.tick - second:
+                connection.window.popleft()
+            sent = sum(size for _, size in connection.window)
+            if busy or sent > BYTES_BUDGET:
+                connection.every = min(connection.every + 1, MAX_SNAPSHOT_EVERY)
+            elif sent < 0.6 * BYTES_BUDGET and connection.every > SNAPSHOT_EVERY:
+                connection.every -= 1
+
+    def stats(self) -> dict:
+        times = np.array(self.tick_times) * 1000
+        return {"clients": len(self.clients), "tick": self.tick, "skipped": self.skipped,
+                "tick_ms": float(times.mean()) if len(times) else 0.0,
+                "tick_ms_p99": float(np.percentile(times, 99)) if len(times) else 0.0,
+                "snapshot_every": sorted(connection.every for connection in self.clients.values())}
+
+    async def run(self, ticks: int = None):
+        # steps at the fixed tick until ticks have run (forever when None), a late server runs up to MAX_CATCH_UP
+        # ticks at once and skips the rest
+        loop = asyncio.get_running_loop()
+        due = loop.time()
+        end = None if ticks is None else self.tick + ticks
+        while end is None or self.tick < end:
+            behind = int((loop.time() - due) / self.tick_seconds) + 1
+            for _ in range(min(behind, MAX_CATCH_UP)):
+                self.step()
+            self.skipped += max(behind - MAX_CATCH_UP, 0)
+            due += behind * self.tick_seconds
+            await asyncio.sleep(max(due - loop.time(), 0))
+
+    async def listen(self, host: str, port: int):
+        server = await asyncio.start_server(lambda reader, writer: self.serve(StreamTransport(reader, writer)),
+                                            host, port)
+        async with server:
+            await self.run()
+
+
+class ClientSimulation(Simulation):
+    # The Simulation of a client, it only predicts its own player and the flight of the pizzas. The tiles change
+    # with the snapshots of the server alone, and the ENEMY tiles of the loaded chunks go to a pool nobody uses:
+    # the enemies shown are the ones of the server.
+
+    def __init__(self, seed: int = 0, level: Level = None):
+        super().__init__(seed, level)
+        self.world.enemies = EnemyPool()
+        self.enemies.clear()
+
+    def _break_breakable(self, x, y):
+        pass
+
+
+class Client:
+    # Plays one player of a Server. step() applies the inputs to the own player at once (prediction) and sends
+    # them. A snapshot puts the own player back where the server had it after the last input it applied and applies
+    # the inputs sent since once more (reconciliation). The other players and the enemies are shown INTERP_TICKS
+    # behind the last snapshot, interpolated between the two snapshots around that time.
+
+    def __init__(self, transport, player: int, sim: ClientSimulation):
+        self.transport = transport
+        self.player = player
+        self.sim = sim
+        self.sequence = 0
+        self.pending = deque()  # (sequence, Inputs) sent and not applied by the server yet
+        self.players = {}  # player id -> (x, y, pose) of the last snapshot
+        self.enemies = {}  # enemy slot -> (x, y) of the last snapshot
+        self.history = deque(maxlen=4 * MAX_SNAPSHOT_EVERY)  # (tick, players, enemies) of the snapshots
+        self.server_tick = 0
+        self.since = 0  # client ticks since the last snapshot
+        self.snapshots = 0
+        self.correction = 0.0  # sum of the distances reconciliation moved the own player
+
+    @classmethod
+    async def connect(cls, transport, level: Level = None) -> "Client":
+        data = await transport.recv()
+        if data is None or data[0] != WELCOME:
+            raise ConnectionError("the server did not welcome the client")
+        _, player, has_seed, seed, level_crc = WELCOME_MESSAGE.unpack(data)
+        sim = ClientSimulation(seed if has_seed else None, level)
+        if zlib.crc32(sim.level.buffer) != level_crc:
+            raise ValueError("the server plays another level")
+        return cls(transport, player, sim)
+
+    async def run(self):
+        # applies the snapshots until the server closes the connection
+        while (data := await self.transport.recv()) is not None:
+            if data[0] == SNAPSHOT:
+                self.receive(data)
+
+    def step(self, inputs: Inputs, dt: float = TICK):
+        self.sequence += 1
+        self.transport.send(INPUT_MESSAGE.pack(INPUT, self.sequence, inputs.bits()))
+        self.pending.append((self.sequence, inputs))
+        sim = self.sim
+        sim.world.update(sim.player_position[0])
+        self._predict(inputs, dt)
+        sim.update_pizzas_position(dt)
+        sim.ticks += dt * 1000
+        sim.tiles.commit()
+        self.since += 1
+
+    def _predict(self, inputs: Inputs, dt: float = TICK):
+        self.sim.handle_inputs(inputs, dt)
+        self.sim.update_player_position(dt)
+
+    def receive(self, data: bytes):
+        sim = self.sim
+        _, tick, last, _, tiles, players, gone_players, enemies, gone_enemies, spawns = \
+            SNAPSHOT_HEADER.unpack_from(data)
+        own = SNAPSHOT_HEADER.size
+        offset = own + sim.PLAYER.size
+        for _ in range(tiles):
+            x, y, code = TILE.unpack_from(data, offset)
+            offset += TILE.size
+            sim.world.load(x // CHUNK_W)
+            sim.tiles.set(x, y, PT_BY_CODE[code])
+        for _ in range(players):
+            player, x, y, pose = PLAYER.unpack_from(data, offset)
+            offset += PLAYER.size
+            self.players[player] = (x / QUANT, y / QUANT, pose)
+        for _ in range(gone_players):
+            self.players.pop(GONE_PLAYER.unpack_from(data, offset)[0], None)
+            offset += GONE_PLAYER.size
+        for _ in range(enemies):
+            slot, x, y = ENEMY.unpack_from(data, offset)
+            offset += ENEMY.size
+            self.enemies[slot] = (x / QUANT, y / QUANT)
+        for _ in range(gone_enemies):
+            self.enemies.pop(GONE_ENEMY.unpack_from(data, offset)[0], None)
+            offset += GONE_ENEMY.size
+        for _ in range(spawns):
+            _, x, y, direction, kind, left = SPAWN.unpack_from(data, offset)
+            offset += SPAWN.size
+            sim.pizzas.spawn(x / QUANT, y / QUANT, Direction.LEFT if direction < 0 else Direction.RIGHT,
+                             sim.ticks + left, PT_BY_CODE[kind])
+
+        # reconciliation, the pizzas of the inputs replayed were thrown already
+        predicted = tuple(sim.player_position)
+        while self.pending and self.pending[0][0] <= last:
+            self.pending.popleft()
+        sim.unpack_player(data, own)
+        for _, inputs in self.pending:
+            self._predict(inputs._replace(throw=False))
+        self.correction += abs(sim.player_position[0] - predicted[0]) + abs(sim.player_position[1] - predicted[1])
+
+        self.history.append((tick, dict(self.players), dict(self.enemies)))
+        self.server_tick = tick
+        self.since = 0
+        self.snapshots += 1
+
+    def interpolate(self) -> list:
+        # moves the enemies of the Simulation to where they were INTERP_TICKS ago, returns the other players as
+        # (x, y, direction, crouch, standing), the Game draws them from its `others`
+        if not self.history:
+            return []
+        target = self.server_tick + self.since - INTERP_TICKS
+        before = after = self.history[-1]
+        for older, newer in zip(self.history, list(self.history)[1:]):
+            if older[0] <= target <= newer[0]:
+                before, after = older, newer
+                break
+        else:
+            if target < self.history[0][0]:
+                before = after = self.history[0]
+        fraction = (target - before[0]) / (after[0] - before[0]) if after[0] != before[0] else 1.0
+
+        def mix(old, new):
+            return old[0] + (new[0] - old[0]) * fraction, old[1] + (new[1] - old[1]) * fraction
+
+        enemies = self.sim.enemies
+        enemies.clear()
+        for slot, position in after[2].items():
+            old = before[2].get(slot, position)
+            enemies.spawn(*mix(old, position))
+        others = []
+        for player, (x, y, pose) in after[1].items():
+            old = before[1].get(player, (x, y, pose))
+            others.append((*mix(old, (x, y)), *POSES[pose]))
+        return others
+
+    def close(self):
+        self.transport.close()
+
+
+def bot_inputs(player: int, frame: int) -> Inputs:
+    # wanders around the start, walking a while one way then the other, jumping and throwing now and then
+    phase = (frame + 37 * player) // 90 % 4
+    return Inputs(left=phase == 2, right=phase == 0, up=(frame + player) % 45 == 0, down=phase == 3,
+                  throw=(frame + 11 * player) % 50 == 0)
+
+
+async def _drive(clients: list, ticks: int, times: list):
+    # steps the bots at the fixed tick
+    loop = asyncio.get_running_loop()
+    due = loop.time()
+    for frame in range(ticks):
+        start = time.perf_counter()
+        for client in clients:
+            client.step(bot_inputs(client.player, frame))
+            client.interpolate()
+        times.append(time.perf_counter() - start)
+        due += TICK
+        await asyncio.sleep(max(due - loop.time(), 0))
+
+
+async def bench(clients: int = 32, seconds: float = 10.0, seed: int = 0, tcp: bool = False) -> dict:
+    # bots on the loopback stand-in (or on localhost TCP) against a server in the same process, the report has
+    # the server time per tick, what every client was sent and how far reconciliation moved the players
+    server = Server(seed)
+    listener = None
+    bots = []
+    if tcp:
+        listener = await asyncio.start_server(
+            lambda reader, writer: server.serve(StreamTransport(reader, writer)), "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+    for _ in range(clients):
+        if tcp:
+            transport = StreamTransport(*await asyncio.open_connection("127.0.0.1", port))
+        else:
+            transport, end = LoopbackTransport.pair()
+            asyncio.create_task(server.serve(end))
+        bots.append(await Client.connect(transport))
+    receivers = [asyncio.create_task(bot.run()) for bot in bots]
+
+    ticks, client_times = round(seconds / TICK), []
+    start, cpu = time.perf_counter(), time.process_time()
+    await asyncio.gather(server.run(ticks), _drive(bots, ticks, client_times))
+    wall, cpu = time.perf_counter() - start, time.process_time() - cpu
+    stats = server.stats()
+    received = [bot.transport.received / seconds for bot in bots]
+    sent = [bot.transport.sent / seconds for bot in bots]
+    tick_ms_per_client = stats["tick_ms"] / clients
+    report = {"clients": clients, "seconds": seconds, "transport": "tcp" if tcp else "loopback", "server": stats,
+              "server_ms_per_client_tick": tick_ms_per_client,
+              "client_ms_per_tick": float(np.mean(client_times) * 1000 / clients),
+              "bytes_per_second_to_client": {"mean": float(np.mean(received)), "max": float(np.max(received))},
+              "bytes_per_second_from_client": float(np.mean(sent)),
+              "snapshots_per_second": float(np.mean([bot.snapshots for bot in bots]) / seconds),
+              "mean_correction": float(np.mean([bot.correction / max(bot.snapshots, 1) for bot in bots])),
+              "process_cpu_share": cpu / wall,
+              "within_budget": max(received) <= BYTES_BUDGET and tick_ms_per_client <= CPU_BUDGET * 1000}
+    for bot in bots:
+        bot.close()
+    await asyncio.gather(*receivers, return_exceptions=True)
+    if listener is not None:
+        listener.close()
+    return report
+
+
+async def play(host: str, port: int, level: Level = None):
+    # a window playing on a server
+    client = await Client.connect(StreamTransport(*await asyncio.open_connection(host, port)), level)
+    game = Game(WIDTH, HEIGHT, sim=client.sim)
+    receiver = asyncio.create_task(client.run())
+    loop = asyncio.get_running_loop()
+    due = loop.time()
+    while game.running and not receiver.done():
+        client.step(game.read_inputs())
+        game.others = client.interpolate()
+        game.render()
+        due += TICK
+        await asyncio.sleep(max(due - loop.time(), 0))
+    client.close()
+
+
+def main():
+    # python multiplayer.py serve [--port 7777] [--seed 0] [--level FILE]
+    # python multiplayer.py play [--host 127.0.0.1] [--port 7777] [--level FILE]
+    # python multiplayer.py bench [--clients 32] [--seconds 10] [--tcp]
+    parser = argparse.ArgumentParser(description="Pizza Boi on a local authoritative server")
+    parser.add_argument("mode", choices=("serve", "play", "bench"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--level", help="level file made by compile_level.py, the same on the server and clients")
+    parser.add_argument("--clients", type=int, default=32, help="bots of the benchmark")
+    parser.add_argument("--seconds", type=float, default=10.0, help="length of the benchmark")
+    parser.add_argument("--tcp", action="store_true", help="benchmark over localhost TCP instead of the loopback")
+    args = parser.parse_args()
+    level = Level.open(args.level) if args.level else None
+
+    if args.mode == "serve":
+        asyncio.run(Server(args.seed, level).listen(args.host, args.port))
+    elif args.mode == "play":
+        asyncio.run(play(args.host, args.port, level))
+    else:
+        report = asyncio.run(bench(args.clients, args.seconds, args.seed, args.tcp))
+        print(json.dumps(report, indent=2))
+        sys.exit(0 if report["within_budget"] else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import bisect
+import heapq
+import math
+from functools import lru_cache
+
+import numpy as np
+
+from main import CHUNK_H, CHUNK_W, PLAYER_JUMP_H, PLAYER_VELOCITY, TICK, TileMap
+
+
+class NavGraph:
+    # Where the player can get to, standing or crouching. A node is a tile (x, y) the player can stand on with the
+    # feet on the row y, like player_position: a block under it and room for the player above. Edges go to the next
+    # column (walk) or to the nodes a jump or a walk off a ledge (fall) lands on, with the time they take.
+    # Jumps and falls come from runs replaying the physics of Simulation once per mode from (0, 0) to every target
+    # column, with full air control: the run moves sideways until it is over its column, right away or after part
+    # of the rise (LEAD, to get onto ledges), then drops. A run keeps the tiles it sweeps as row masks per column and
+    # the rows it crosses over its column, so the edges of a node only AND those masks with the solidity bitmap of
+    # the TileMap. Edges are stored per start column, built for the loaded chunks when the graph is made and then
+    # kept current from the change journal of the TileMap. A run stops at the first row it lands on or is blocked at,
+    # so every node keeps the event and the column every run going each way stopped at (reads), and the graph keeps
+    # the solidity bitmaps it was built from (masks): a change only rebuilds the nodes with a tile that got solid
+    # above the lowest rows their runs read or a tile that got free where they stopped, and the nodes that appeared
+    # or disappeared. close() stops following the journal, open() catches up and follows it again.
+    LEAD = (0, 0.5, 1)  # part of the rise of a jump done before moving sideways
+    BIAS = CHUNK_H  # run masks keep the row y at the bit y + BIAS, the rows above the start are negative
+
+    def __init__(self, tiles: TileMap, gravity: float, dt: float = TICK):
+        self.tiles = tiles
+        self.modes = {crouch: self._runs(PLAYER_VELOCITY.get(name), PLAYER_JUMP_H.get(name), 1 if crouch else 2,
+                                         gravity, dt)
+                      for crouch, name in ((False, "normal"), (True, "crouch"))}
+        # columns away from its start a run can land, a tile change only affects the nodes that close to it
+        self.reach = max(dx for runs in self.modes.values() for dx, _, _ in runs)
+        # crouch -> the highest row (from the start) a run sweeps, the reads of a node start there
+        self.top = {crouch: min((bits & -bits).bit_length() - 1 - self.BIAS
+                                for _, _, events in runs for clear, _, _, _ in events for _, bits in clear)
+                    for crouch, runs in self.modes.items()}
+        self.spans = {crouch: self._spans(runs, self.reach) for crouch, runs in self.modes.items()}
+        self.edges = {False: {}, True: {}}  # crouch -> x -> {y: [(to x, to y, seconds, kind), ...]}
+        # crouch -> x -> {y: {direction: ([the event every run going that way stopped at, ...], [the column it was
+        # blocked at, -1 when it read the whole event: it landed or never stopped, ...])}}
+        self.reads = {False: {}, True: {}}
+        self.masks = {}  # x -> solidity bitmap of the column x the edges were built from, the absent ones are 0
+        self.built = {}  # chunk index -> TileMap version the edges of its columns were built from
+        self.open()
+
+    def open(self):
+        if self.on_changes not in self.tiles.subscribers:
+            self.sync()
+            self.tiles.subscribe(self.on_changes)
+
+    def close(self):
+        if self.on_changes in self.tiles.subscribers:
+            self.tiles.unsubscribe(self.on_changes)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _runs(velocity: float, jump_height: float, height: int, gravity: float, dt: float) -> tuple:
+        # (dx, kind, events) moving right, an event is (masks, r, seconds, n): when the (column, row mask) tiles of
+        # masks are free, the box is over the column dx with the feet crossing the row r after that many seconds, n
+        # is the index of the event in the run
+        jump_velocity = (2 * gravity * jump_height) ** 0.5
+        apex = jump_velocity / gravity / dt
+        runs = []
+        for kind, lead in [("fall", 0)] + [("jump", lead) for lead in NavGraph.LEAD]:
+            dx = 1
+            while True:
+                events = NavGraph._run(velocity, -jump_velocity if kind == "jump" else 0, height, gravity, dt,
+                                       round(lead * apex), dx, kind == "fall")
+                if not events:  # the farther columns are reached even lower, below the world
+                    break
+                runs.append((dx, kind, tuple(events)))
+                dx += 1
+        return tuple(runs)
+
+    @staticmethod
+    def _run(velocity, jump_velocity, height, gravity, dt, lead, dx, falls_off) -> list:
+        x = y = 0.0
+        steps, events, masks = 0, [], {}
+
+        def sweep(x0, y0, x1, y1):
+            rows = range(math.floor(min(y0, y1) + 1 - height), math.ceil(max(y0, y1) + 1))
+            bits = sum(1 << (row + NavGraph.BIAS) for row in rows)
+            for column in range(math.floor(min(x0, x1)), math.ceil(max(x0, x1) + 1)):
+                masks[column] = masks.get(column, 0) | bits
+
+        while y <= CHUNK_H:
+            steps += 1
+            x0, y0 = x, y
+            if steps > lead:
+                x = min(x + velocity * dt, dx)
+            y += jump_velocity * dt + 0.5 * gravity * dt ** 2
+            jump_velocity += gravity * dt
+            if falls_off and x < 1 and y > 0:  # still on the tile it walks off
+                y = jump_velocity = 0.0
+            if x == dx:
+                for row in range(math.floor(y0) + 1, math.floor(y) + 1):
+                    sweep(x0, y0, x, row)
+                    events.append((tuple(masks.items()), row, steps * dt, len(events)))
+                    masks = {}
+            sweep(x0, y0, x, y)
+        return events
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def _spans(runs: tuple, reach: int) -> tuple:
+        # (lows, firsts, lasts) by (run, n, column), in rows from the start: firsts and lasts are the first and last
+        # rows the event n of the run reads in the column, the support of the landing included (firsts > lasts when
+        # it reads none), lows the last row the run read there before that event
+        shape = (len(runs), max(len(events) for _, _, events in runs) + 1, reach + 1)
+        firsts, lasts = np.full(shape, 2 * CHUNK_H), np.full(shape, -2 * CHUNK_H)
+        for run, (dx, _, events) in enumerate(runs):
+            for clear, r, _, n in events:
+                for column, bits in clear:
+                    firsts[run, n, column] = (bits & -bits).bit_length() - 1 - NavGraph.BIAS
+                    lasts[run, n, column] = bits.bit_length() - 1 - NavGraph.BIAS
+                firsts[run, n, dx] = min(firsts[run, n, dx], r + 1)
+                lasts[run, n, dx] = max(lasts[run, n, dx], r + 1)
+        lows = np.roll(np.maximum.accumulate(lasts, axis=1), 1, axis=1)
+        lows[:, 0] = -2 * CHUNK_H
+        return lows, firsts, lasts
+
+    @staticmethod
+    def _standing(mask: int, height: int) -> int:
+        # bit y is set when a box of that height can stand on the row y of the column with that solidity mask
+        free = ~mask & ((1 << (CHUNK_H - 1)) - 1)
+        stand = free & (mask >> 1)
+        return stand & ~(mask << 1) if height == 2 else stand
+
+    def nodes(self, x: int, crouch: bool = False) -> list:
+        return list(self.edges[crouch].get(x, ()))
+
+    def _node_edges(self, x: int, y: int, crouch: bool, standing: dict, masks: dict) -> tuple:
+        # (edges, reads) of the node, see reads in __init__
+        # the masks of the columns around x moved so the row y is at the bit BIAS, like in the runs
+        reach, shift = self.reach, self.BIAS - y
+        around = [masks[column] << shift for column in range(x - reach, x + reach + 1)]
+        edges, reads = {}, {}
+        for direction in (1, -1):
+            stops, blocks = [], []
+            if standing[x + direction] >> y & 1:
+                edges[(x + direction, y)] = (1 / PLAYER_VELOCITY.get("crouch" if crouch else "normal"), "walk")
+            for dx, kind, events in self.modes[crouch]:
+                support = around[reach + direction * dx]
+                for clear, r, seconds, n in events:
+                    for column, bits in clear:
+                        if around[reach + direction * column] & bits:
+                            break
+                    else:
+                        if y + r < 0 or not support >> (r + 1 + self.BIAS) & 1:
+                            continue
+                        column = -1
+                        target = (x + direction * dx, y + r)  # lands there
+                        if seconds < edges.get(target, (math.inf,))[0]:
+                            edges[target] = (seconds, kind)
+                    break
+                else:
+                    column = -1
+                stops.append(n)
+                blocks.append(column)
+            reads[direction] = (stops, blocks)
+        return [(tx, ty, seconds, kind) for (tx, ty), (seconds, kind) in edges.items()], reads
+
+    def _reads(self, crouch: bool, x: int, y: int, columns: list, changed: dict, solid: dict) -> bool:
+        # whether the node (x, y) read one of the changed rows of the columns: the node and its walks read the rows
+        # around y next to it, the runs the rows of the events they read whole (the ones that got solid matter), the
+        # tiles they were blocked at and the supports they landed on, under the targets of the edges (the ones that
+        # got free)
+        lows, firsts, lasts = self.spans[crouch]
+        runs, top, profiles = np.arange(len(self.modes[crouch])), max(y + self.top[crouch], 0), {}
+        for column in columns:
+            dx = abs(column - x)
+            if dx <= 1 and changed[column] >> max(y - 1, 0) & 7:
+                return True
+            freed = changed[column] ^ solid[column]
+            if freed and any(tx == column and freed >> (ty + 1) & 1 for tx, ty, _, _ in self.edges[crouch][x][y]):
+                return True
+            for direction in (1, -1) if column == x else (1,) if column > x else (-1,):
+                stops, blocks = self.reads[crouch][x][y][direction]
+                if solid[column]:
+                    if direction not in profiles:  # the lowest row read in every column
+                        profiles[direction] = lows[runs, np.add(stops, np.less(blocks, 0))].max(axis=0).tolist()
+                    bottom = min(y + profiles[direction][dx], CHUNK_H - 1)
+                    if top <= bottom and solid[column] >> top & (1 << (bottom - top + 1)) - 1:
+                        return True
+                if freed and dx in blocks:
+                    first, last = firsts[runs, stops, dx], lasts[runs, stops, dx]
+                    blocked = np.equal(blocks, dx)
+                    for row in range(freed.bit_length()):
+                        if freed >> row & 1 and (blocked & (first <= row - y) & (row - y <= last)).any():
+                            return True
+        return False
+
+    def sync(self):
+        # takes the chunks the TileMap got, rewrote or dropped since the last call
+        dropped = [index for index in self.built if index not in self.tiles.chunks]
+        changed = [index for index, version in self.tiles.versions.items() if self.built.get(index) != version]
+        self._rebuild(changed + dropped, [])
+
+    def on_changes(self, tiles: list, chunks: set):
+        # subscriber of the TileMap journal
+        self._rebuild([index for index in chunks if index in self.built or index in self.tiles.chunks],
+                      [x for x, _ in tiles])
+
+    def _rebuild(self, indices: list, xs: list):
+        # compares the columns of the chunks of indices and the columns xs with the masks the edges were built from,
+        # then rebuilds the nodes that read a changed row
+        columns = set(xs)
+        for index in indices:
+            if index in self.tiles.chunks:
+                self.built[index] = self.tiles.versions[index]
+            else:
+                self.built.pop(index, None)
+            columns.update(range(index * CHUNK_W, (index + 1) * CHUNK_W))
+        for x in set(xs):
+            if x // CHUNK_W in self.built:
+                self.built[x // CHUNK_W] = self.tiles.versions[x // CHUNK_W]
+
+        changed = {}  # x -> rows of the column x that changed
+        for x in columns:
+            mask = self.tiles.column_mask(x)
+            if mask != self.masks.get(x, 0):
+                changed[x] = mask ^ self.masks.get(x, 0)
+                if mask:
+                    self.masks[x] = mask
+                else:
+                    del self.masks[x]
+        if changed:
+            for crouch in (False, True):
+                self._rebuild_nodes(crouch, changed)
+
+    def _rebuild_nodes(self, crouch: bool, changed: dict):
+        edges, reads, reach = self.edges[crouch], self.reads[crouch], self.reach
+        xs = sorted(changed)
+        solid = {x: rows & self.masks.get(x, 0) for x, rows in changed.items()}  # the changed rows that got solid
+        todo = set()
+        # the nodes in reach of a changed column that read one of its changed rows
+        starts = set()
+        for x in xs:
+            starts.update(column for column in range(x - reach, x + reach + 1) if column in reads)
+        for start in starts:
+            near = xs[bisect.bisect_left(xs, start - reach):bisect.bisect_right(xs, start + reach)]
+            todo.update((start, y) for y in reads[start] if self._reads(crouch, start, y, near, changed, solid))
+        # and the nodes of the changed columns, some of them are new and some are gone
+        height = 1 if crouch else 2
+        for x in xs:
+            standing = self._standing(self.masks.get(x, 0), height)
+            for y in [y for y in edges.get(x, ()) if not standing >> y & 1]:
+                del edges[x][y], reads[x][y]
+            if x in edges and not edges[x]:
+                del edges[x], reads[x]
+            while standing:
+                low = standing & -standing
+                standing ^= low
+                todo.add((x, low.bit_length() - 1))
+        if not todo:
+            return
+
+        first, last = min(x for x, _ in todo), max(x for x, _ in todo)
+        masks = {x: self.masks.get(x, 0) for x in range(first - reach, last + reach + 1)}
+        standing = {x: self._standing(masks[x], height) for x in range(first - 1, last + 2)}
+        for x, y in todo:
+            if standing[x] >> y & 1:  # not a node that is gone
+                edges.setdefault(x, {})[y], reads.setdefault(x, {})[y] = self._node_edges(x, y, crouch, standing, masks)
+
+    def path(self, start: tuple[int, int], goal: tuple[int, int], crouch: bool = False) -> list:
+        # fastest way between two nodes, A* over the built chunks: [(x, y, kind), ...] from the start (kind None)
+        # to the goal, None when the goal cannot be reached. The player moves at most its velocity sideways, so the
+        # time to walk the columns between a node and the goal never overestimates the rest of the way.
+        edges = self.edges[crouch]
+        velocity = PLAYER_VELOCITY.get("crouch" if crouch else "normal")
+        start, goal = tuple(start), tuple(goal)
+        came = {start: None}
+        cost = {start: 0.0}
+        frontier = [(abs(goal[0] - start[0]) / velocity, 0.0, start)]
+        while frontier:
+            _, seconds, node = heapq.heappop(frontier)
+            if node == goal:
+                way = []
+                while node is not None:
+                    previous = came[node]
+                    way.append((*node, previous[1] if previous else None))
+                    node = previous[0] if previous else None
+                return way[::-1]
+            if seconds > cost[node]:
+                continue
+            for x, y, step, kind in edges.get(node[0], {}).get(node[1], ()):
+                total = seconds + step
+                if total < cost.get((x, y), math.inf):
+                    cost[(x, y)] = total
+                    came[(x, y)] = (node, kind)
+                    heapq.heappush(frontier, (total + abs(goal[0] - x) / velocity, total, (x, y)))
+        return None
+
+    def reachable(self, start: tuple[int, int], crouch: bool = False) -> set:
+        # every node the player can get to from the node start
+        edges = self.edges[crouch]
+        seen, todo = {tuple(start)}, [tuple(start)]
+        while todo:
+            x, y = todo.pop()
+            for tx, ty, _, _ in edges.get(x, {}).get(y, ()):
+                if (tx, ty) not in seen:
+                    seen.add((tx, ty))
+                    todo.append((tx, ty))
+        return seen
@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+import time
+
+from main import CHUNK_W, Level, Maps, Simulation
+from navigation import NavGraph
+
+
+def check(seed: int, builder: str = None, chunks: int = 16, crouch: bool = False) -> dict:
+    # can the player get from the start to the last of the first chunks of the world of the seed (on the level of
+    # the Maps builder, the default level when None), following the jumps and falls of the NavGraph
+    level = Level(Level.compile(getattr(Maps, builder))) if builder else None
+    sim = Simulation(seed, level)
+    for index in range(chunks):
+        sim.world.load(index)
+    start = time.perf_counter()
+    sim.nav = NavGraph(sim.tiles, sim.GRAVITY)
+    built = time.perf_counter() - start
+
+    begin = tuple(sim.level.start)
+    reached = sim.nav.reachable(begin, crouch)
+    furthest = max(reached)
+    passed = furthest[0] >= (chunks - 1) * CHUNK_W
+    way = sim.nav.path(begin, furthest, crouch)
+    return {"seed": seed, "builder": builder or "default", "crouch": crouch, "passed": passed,
+            "furthest": list(furthest), "nodes": len(reached), "edges": len(way) - 1,
+            "jumps": sum(step[2] == "jump" for step in way), "build_seconds": built,
+            "blocked_chunk": None if passed else furthest[0] // CHUNK_W}
+
+
+def main():
+    # python reachability.py [--seeds 0:100] [--chunks 16] [--builder map_0] [--crouch] [--output report.json]
+    parser = argparse.ArgumentParser(description="Check that the generated worlds can be crossed")
+    parser.add_argument("--seeds", metavar="FIRST:LAST", default="0:100", help="check the seeds FIRST..LAST-1")
+    parser.add_argument("--chunks", type=int, default=16, help="chunks of every world to cross")
+    parser.add_argument("--builder", help="Maps builder of the level, the default level otherwise")
+    parser.add_argument("--crouch", action="store_true", help="cross them crouching")
+    parser.add_argument("--output", help="write the JSON report there instead of stdout")
+    args = parser.parse_args()
+
+    first, last = map(int, args.seeds.split(":"))
+    results = [check(seed, args.builder, args.chunks, args.crouch) for seed in range(first, last)]
+    failed = [result["seed"] for result in results if not result["passed"]]
+    text = json.dumps({"failed": failed, "results": results}, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(text + "\n")
+    else:
+        print(text)
+    print(f"{len(results)} worlds, {len(failed)} cannot be crossed", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+import argparse
+import json
+import sys
+import time
+import zlib
+
+from main import Level, Recording, Simulation
+
+
+def replay(path: str, level_path: str = None, check: bool = True) -> dict:
+    # plays a recording back through a Simulation as fast as possible, without a display or a frame limiter.
+    # level_path overrides the level file named in the recording. Stops at the first checksum that differs.
+    recording = Recording(path)
+    level_path = level_path or recording.level_path
+    level = Level.open(level_path) if level_path else None
+    sim = Simulation(recording.seed, level)
+    if zlib.crc32(sim.level.buffer) != recording.level_crc:
+        raise ValueError(f"{level_path or 'the default level'} is not the level the recording was made with")
+
+    frames, diverged, checks = 0, None, 0
+    start = time.perf_counter()
+    for inputs, dt, checksum in recording.frames():
+        sim.step(inputs, dt)
+        frames += 1
+        if check and checksum is not None:
+            checks += 1
+            if sim.checksum() != checksum:
+                diverged = frames
+                break
+    seconds = time.perf_counter() - start
+    return {"recording": path, "frames": frames, "game_seconds": sim.ticks / 1000, "seconds": seconds,
+            "steps_per_second": frames / seconds if seconds else 0.0, "checks": checks, "diverged_at": diverged}
+
+
+def main():
+    # python replay.py <recording> [--level FILE] [--no-check]
+    parser = argparse.ArgumentParser(description="Replay sessions recorded with main.py --record")
+    parser.add_argument("recording")
+    parser.add_argument("--level", help="level file to use instead of the one named in the recording")
+    parser.add_argument("--no-check", action="store_true", help="do not compare the state checksums")
+    args = parser.parse_args()
+
+    result = replay(args.recording, args.level, not args.no_check)
+    print(json.dumps(result, indent=2))
+    if result["diverged_at"] is not None:
+        print(f"diverged at frame {result['diverged_at']}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
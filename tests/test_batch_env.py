@@ -0,0 +1,30 @@
+import numpy as np
+
+from batch_env import BatchEnv
+from main import Inputs, Simulation
+
+
+def test_batch_env_matches_simulation():
+    # every world of a BatchEnv follows the Simulation given the same inputs, to the last bit
+    n = 16
+    rng = np.random.default_rng(1)
+    env = BatchEnv(n)
+    sims = [Simulation(None) for _ in range(n)]
+    actions = rng.random((n, 4)) < 0.3
+    for step in range(600):
+        actions ^= rng.random((n, 4)) < 0.05
+        env.step(actions)
+        for sim, (left, right, up, down) in zip(sims, actions.tolist()):
+            sim.step(Inputs(left=left, right=right, up=up, down=down))
+        assert np.array_equal(env.x, [sim.player_position[0] for sim in sims]), step
+        assert np.array_equal(env.y, [sim.player_position[1] for sim in sims]), step
+        assert np.array_equal(env.crouch, [sim.player_crouch for sim in sims]), step
+
+
+def test_reset_observes_the_reset_worlds():
+    env = BatchEnv(4)
+    start = env.reset()
+    env.step(np.tile([False, True, True, False], (4, 1)))
+    observation = env.reset([1, 2])
+    assert np.array_equal(observation[[1, 2]], start[[1, 2]])
+    assert env.resets.tolist() == [2, 3, 3, 2]  # made, reset() and the reset of the worlds 1 and 2
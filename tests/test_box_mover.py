@@ -0,0 +1,41 @@
+import numpy as np
+
+from main import CHUNK_H, IS_BLOCK, TICK, Simulation
+
+
+def _world() -> Simulation:
+    sim = Simulation(5)
+    for index in range(4):
+        sim.world.load(index)
+    return sim
+
+
+def test_one_box_moves_like_the_arrays():
+    sim = _world()
+    rng = np.random.default_rng(2)
+    n = 2000
+    x = np.where(rng.random(n) < 0.5, rng.integers(1, 120, n), rng.uniform(1, 120, n))
+    y = np.where(rng.random(n) < 0.5, rng.integers(0, CHUNK_H, n), rng.uniform(-2, CHUNK_H, n))
+    height = rng.integers(1, 3, n)
+    move, jump_velocity = rng.uniform(-1.5, 1.5, n), rng.uniform(-40, 40, n)
+
+    moved = sim.mover.move(x, y, 1, height, move, jump_velocity, sim.GRAVITY, TICK)
+    one_by_one = [sim.mover.move(float(x[i]), float(y[i]), 1, int(height[i]), float(move[i]), float(jump_velocity[i]),
+                                 sim.GRAVITY, TICK) for i in range(n)]
+    for array, values in zip(moved, zip(*one_by_one)):
+        assert np.array_equal(array, np.array(values, dtype=float))
+
+    touching = sim.mover.touching(x, y + 1 - height, 1, height)
+    expected = [sim.collider.touching(float(x[i]), float(y[i] + 1 - height[i]), 1, int(height[i])) for i in range(n)]
+    for side, values in zip(touching, zip(*expected)):
+        assert np.array_equal(side, np.array(values))
+    assert any(side.any() for side in touching)
+
+
+def test_solid_many_reads_the_bitmaps():
+    sim = _world()
+    rng = np.random.default_rng(4)
+    xs, ys = rng.integers(-10, 140, 5000), rng.integers(-3, CHUNK_H + 3, 5000)
+    solid = sim.collider.solid_many(xs.astype(float), ys.astype(float))
+    assert np.array_equal(solid, IS_BLOCK[sim.tiles.get_many(xs, ys)])
+    assert solid.any()
@@ -0,0 +1,26 @@
+import pytest
+
+from main import FixedTimestep
+
+
+@pytest.mark.parametrize("hz", [30, 60, 144])
+def test_steps_follow_the_wall_clock_at_any_frame_rate(hz):
+    timestep = FixedTimestep(1 / 60)
+    steps = sum(timestep.advance(1 / hz) for _ in range(hz * 10))
+    assert abs(steps - 600) <= 1
+    assert 0 <= timestep.alpha < 1
+
+
+def test_catch_up_is_capped():
+    timestep = FixedTimestep(1 / 60, max_steps=5)
+    assert timestep.advance(0.5) == 5
+    assert timestep.dropped == 25
+    assert timestep.accumulator < timestep.dt
+
+
+def test_alpha_is_the_part_of_a_step_left_over():
+    timestep = FixedTimestep(0.01)
+    assert timestep.advance(0.025) == 2
+    assert timestep.alpha == pytest.approx(0.5)
+    assert timestep.advance(0.004) == 0
+    assert timestep.alpha == pytest.approx(0.9)
@@ -0,0 +1,41 @@
+import pytest
+
+from main import CHUNK_H, CHUNK_W, H_BLOCKS, PT, Level, TileMap
+
+
+def build(tiles: TileMap) -> tuple[int, int]:
+    for x in range(3, 40, 5):
+        tiles.set(x, H_BLOCKS - 3, PT.BOX)
+    tiles.set(2 * CHUNK_W + 7, 10, PT.BRICK)
+    return 5, H_BLOCKS - 3
+
+
+def test_saved_level_loads_memory_mapped(tmp_path):
+    path = tmp_path / "level.pzlv"
+    path.write_bytes(Level.compile(build))
+    level = Level.open(str(path))
+
+    expected = TileMap()
+    build(expected)
+    assert level.start == (5, H_BLOCKS - 3)
+    assert sorted(level.offsets) == [0, 1, 2]
+    for index in range(3):
+        chunk = level.chunk(index)
+        for x in range(CHUNK_W):
+            for y in range(H_BLOCKS - 2):
+                assert chunk[x * CHUNK_H + y] == expected.get(index * CHUNK_W + x, y).value
+    assert 3 not in level
+
+
+def test_bad_magic_is_refused():
+    data = bytearray(Level.compile(build))
+    data[:4] = b"NOPE"
+    with pytest.raises(ValueError, match="not a level file"):
+        Level(bytes(data))
+
+
+def test_other_version_is_refused():
+    data = bytearray(Level.compile(build))
+    data[4:6] = (Level.VERSION + 1).to_bytes(2, "little")
+    with pytest.raises(ValueError, match="version"):
+        Level(bytes(data))
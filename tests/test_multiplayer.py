@@ -0,0 +1,100 @@
+import asyncio
+
+from main import CHUNK_W, PT, Inputs
+from multiplayer import QUANT, Client, LoopbackTransport, Server
+
+
+async def settle():
+    # lets the serve() and run() tasks take the messages sent so far
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+async def connect(server: Server) -> Client:
+    client_end, server_end = LoopbackTransport.pair()
+    asyncio.get_running_loop().create_task(server.serve(server_end))
+    client = await Client.connect(client_end)
+    asyncio.get_running_loop().create_task(client.run())
+    await settle()
+    server.clients[client.player].every = 1  # a snapshot every tick, so the tests see every one of them
+    server.clients[client.player].next = server.tick
+    return client
+
+
+async def tick(server: Server, clients: list, inputs=Inputs()):
+    for client in clients:
+        client.step(inputs)
+    await settle()
+    server.step()
+    await settle()
+
+
+def same_tiles(client: Client, server: Server) -> bool:
+    common = set(client.sim.tiles.chunks) & set(server.sim.tiles.chunks)
+    return bool(common) and all(client.sim.tiles.chunks[index] == server.sim.tiles.chunks[index] for index in common)
+
+
+def edit(server: Server) -> list:
+    # a box put down and then broken, and a brick put down, near the start
+    sim = server.sim
+    x = int(sim.level.start[0]) + 4
+    sim.tiles.set(x, 5, PT.BOX)
+    sim.tiles.set(x + 1, 5, PT.BOX)
+    sim._break_breakable(x + 1, 5)
+    sim.tiles.set(x + 2, 6, PT.BRICK)
+    return [(x, 5), (x + 1, 5), (x + 2, 6)]
+
+
+def test_snapshots_carry_the_other_players_and_enemies():
+    async def run():
+        server = Server(0)
+        first, second = await connect(server), await connect(server)
+        for frame in range(60):
+            await tick(server, [first, second], Inputs(right=frame < 30, up=frame % 20 == 0))
+        for _ in range(3):  # the server applies the inputs still queued, the clients have nothing pending after it
+            await tick(server, [])
+        fields = server.sim.fields(second.player)
+        x, y, _ = first.players[second.player]
+        assert (x, y) == (round(fields[0] * QUANT) / QUANT, round(fields[1] * QUANT) / QUANT)
+        enemies = server.sim.enemies
+        near = {slot: (round(enemies.x[slot] * QUANT) / QUANT, round(enemies.y[slot] * QUANT) / QUANT)
+                for slot in enemies.live().tolist() if abs(enemies.x[slot] - fields[0]) < CHUNK_W}
+        assert {slot: first.enemies[slot] for slot in near if slot in first.enemies} == near
+        assert second.sim.player_position == list(fields[:2])
+    asyncio.run(run())
+
+
+def test_client_tiles_follow_the_server_and_late_joiners_get_the_edits():
+    async def run():
+        server = Server(0)
+        early = await connect(server)
+        await tick(server, [early])
+        edited = edit(server)
+        for _ in range(5):
+            await tick(server, [early])
+        assert same_tiles(early, server)
+
+        late = await connect(server)
+        for _ in range(5):
+            await tick(server, [early, late])
+        assert same_tiles(late, server)
+        for x, y in edited:
+            assert late.sim.tiles.get(x, y) == server.sim.tiles.get(x, y)
+    asyncio.run(run())
+
+
+def test_prediction_reconciles_with_a_server_correction():
+    async def run():
+        server = Server(0)
+        client = await connect(server)
+        for _ in range(20):
+            await tick(server, [client], Inputs(right=True))
+        sim = server.sim
+        sim.unpack_player(sim.players[client.player])
+        sim.player_position[0] -= 6  # the server disagrees with the prediction
+        sim.players[client.player] = sim.pack_player()
+        for _ in range(20):
+            await tick(server, [client], Inputs(right=True))
+        assert client.correction > 5
+        assert client.sim.player_position == list(sim.fields(client.player)[:2])
+    asyncio.run(run())
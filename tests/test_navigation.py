@@ -0,0 +1,49 @@
+import random
+
+from main import H_BLOCKS, IS_BLOCK, PT, Inputs, Simulation
+from navigation import NavGraph
+
+
+def edges(nav: NavGraph, crouch: bool) -> dict:
+    return {x: {y: sorted(to) for y, to in column.items()} for x, column in nav.edges[crouch].items()}
+
+
+def test_incremental_edges_match_a_fresh_build():
+    # boxes broken and chunks streamed in and out while the graph follows the journal of the tiles
+    sim = Simulation(3)
+    sim.nav = NavGraph(sim.tiles, sim.GRAVITY)
+    x0 = int(sim.player_position[0]) + 3
+    for x in range(x0, x0 + 40):
+        for y in range(H_BLOCKS - 8, H_BLOCKS - 2):
+            sim.tiles.set(x, y, PT.BOX)
+    for frame in range(600):
+        sim.step(Inputs(right=True, up=frame % 40 < 2, down=frame % 4 < 2, throw=frame % 2 == 0))
+
+    fresh = NavGraph(sim.tiles, sim.GRAVITY)
+    for crouch in (False, True):
+        assert edges(sim.nav, crouch) == edges(fresh, crouch)
+
+
+def test_single_tile_changes_match_a_fresh_build():
+    # every change either frees a tile or fills one, under, inside and above the runs of the nodes around it
+    sim = Simulation(3)
+    nav = NavGraph(sim.tiles, sim.GRAVITY)
+    rng = random.Random(1)
+    xs = sorted(nav.masks)[30:-30]
+    for _ in range(60):
+        x, y = rng.choice(xs), rng.randrange(H_BLOCKS - 14, H_BLOCKS - 1)
+        sim.tiles.set(x, y, PT.BACKGROUND if IS_BLOCK[sim.tiles.get(x, y).value] else PT.BOX)
+        sim.tiles.commit()
+        fresh = NavGraph(sim.tiles, sim.GRAVITY)
+        fresh.close()
+        for crouch in (False, True):
+            assert edges(nav, crouch) == edges(fresh, crouch), (x, y)
+
+
+def test_replaced_graph_stops_following_the_tiles():
+    sim = Simulation(3)
+    nav = sim.nav = NavGraph(sim.tiles, sim.GRAVITY)
+    sim.nav = None
+    assert nav.on_changes not in sim.tiles.subscribers
+    sim.nav = nav
+    assert sim.tiles.subscribers.count(nav.on_changes) == 1
@@ -0,0 +1,26 @@
+import numpy as np
+
+from main import PT, Direction, ProjectilePool
+
+
+def spawn(pool: ProjectilePool) -> int:
+    return pool.spawn(1.0, 2.0, Direction.RIGHT, 1000, PT.PIZZA)
+
+
+def test_freed_slots_are_reused_lowest_first():
+    pool = ProjectilePool(8)
+    assert [spawn(pool) for _ in range(5)] == [0, 1, 2, 3, 4]
+    pool.kill(np.array([3, 1]))
+    assert len(pool) == 3
+    assert pool.live().tolist() == [0, 2, 4]
+    assert [spawn(pool) for _ in range(3)] == [1, 3, 5]
+
+
+def test_full_pool_refuses_and_shrinks_when_emptied():
+    pool = ProjectilePool(4)
+    assert [spawn(pool) for _ in range(5)] == [0, 1, 2, 3, -1]
+    pool.kill(np.array([3, 2]))
+    assert pool.size == 2
+    pool.clear()
+    assert len(pool) == 0 and pool.size == 0
+    assert spawn(pool) == 0
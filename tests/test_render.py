@@ -0,0 +1,59 @@
+import pygame
+import pytest
+
+from main import HEIGHT, PT, WIDTH, Direction, Game, Inputs
+
+
+@pytest.fixture
+def game():
+    game = Game(WIDTH, HEIGHT)
+    yield game
+    pygame.quit()
+
+
+def full_frame(game: Game) -> bytes:
+    # the frame render() would draw from scratch, leaving the state of the dirty rendering as it was
+    screen, camera, sprite_rects = game.screen, game._camera, game._sprite_rects
+    game.screen, game._camera = screen.copy(), None
+    game.render()
+    pixels = pygame.image.tostring(game.screen, "RGB")
+    game.screen, game._camera, game._sprite_rects = screen, camera, sprite_rects
+    return pixels
+
+
+def test_dirty_frames_match_full_redraws(game):
+    snapshot = None
+    for frame in range(300):
+        phase = frame // 50 % 3
+        inputs = Inputs(right=phase == 1, left=phase == 2 and frame % 20 < 2, up=frame % 37 < 3,
+                        down=frame % 20 < 5, throw=frame % 10 == 0)
+        if frame == 20:
+            snapshot = game.sim.snapshot()
+        if frame in (10, 120, 220):
+            game.sim._break_breakable(31 + frame // 100, 33)
+        if frame in (150, 250):
+            game.sim.restore(snapshot)
+        game.keep_previous()
+        game.sim.step(inputs)
+        game.alpha = frame % 4 / 4 or 1.0
+        game.render()
+        assert pygame.image.tostring(game.screen, "RGB") == full_frame(game), frame
+
+
+def test_many_sprites_fall_back_to_full_frames(game):
+    sim = game.sim
+    for i in range(400):
+        sim.pizzas.spawn(sim.player_position[0] - 30 + i % 60, i % 30, Direction.RIGHT, 10 ** 9, PT.PIZZA)
+    for _ in range(3):
+        sim.step(Inputs())
+        game.render()
+        assert game.pixels_pushed == WIDTH * HEIGHT
+        assert pygame.image.tostring(game.screen, "RGB") == full_frame(game)
+
+
+def test_merged_rects_cover_the_dirty_ones_without_overlapping():
+    rects = [pygame.Rect(x, y, 30, 30) for x in range(0, 400, 25) for y in (0, 100, 110)] + [pygame.Rect(5, 5, 0, 9)]
+    merged = Game._merge(rects, 64)
+    assert all(a.collidelist([b for b in merged if b is not a]) < 0 for a in merged)
+    assert all(any(union.contains(rect) for union in merged) for rect in rects if rect.w)
+    assert Game._merge(rects, 1) is None
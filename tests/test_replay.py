@@ -0,0 +1,37 @@
+import random
+
+from main import Inputs, Recorder, Simulation
+from replay import replay
+
+
+def record(path: str, frames: int = 600) -> int:
+    sim = Simulation(5)
+    recorder = Recorder(path, sim)
+    rng = random.Random(2)
+    inputs = Inputs()
+    for frame in range(frames):
+        if frame % 15 == 0:
+            inputs = Inputs(*(rng.random() < p for p in (0.3, 0.6, 0.2, 0.1, 0.3)))
+        dt = rng.choice((16, 17, 33)) / 1000
+        sim.step(inputs, dt)
+        recorder.record(inputs, dt)
+    recorder.close()
+    return sim.checksum()
+
+
+def test_recording_replays_without_divergence(tmp_path):
+    path = str(tmp_path / "session.pzrc")
+    record(path)
+    result = replay(path)
+    assert result["frames"] == 600
+    assert result["checks"] > 0
+    assert result["diverged_at"] is None
+
+
+def test_replay_notices_a_divergence(tmp_path):
+    path = tmp_path / "session.pzrc"
+    record(str(path))
+    data = bytearray(path.read_bytes())
+    data[8] ^= 1  # another seed
+    path.write_bytes(data)
+    assert replay(str(path))["diverged_at"] is not None
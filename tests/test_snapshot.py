@@ -0,0 +1,31 @@
+from main import Inputs, Simulation
+
+
+def inputs(frame: int) -> Inputs:
+    return Inputs(right=frame % 300 < 250, up=frame % 40 < 2, down=frame % 7 < 3, throw=frame % 3 == 0)
+
+
+def test_restore_replays_to_the_same_checksum():
+    sim = Simulation(5)
+    for frame in range(300):
+        sim.step(inputs(frame))
+    snapshots = []
+    for frame in range(300, 500):
+        snapshots.append((frame, sim.snapshot(), sim.checksum()))
+        sim.step(inputs(frame))
+    end = sim.checksum()
+
+    for frame, snapshot, checksum in snapshots[::40]:
+        sim.restore(snapshot)
+        assert sim.checksum() == checksum
+        for again in range(frame, 500):
+            sim.step(inputs(again))
+        assert sim.checksum() == end, f"diverged after restoring the snapshot of frame {frame}"
+
+
+def test_unchanged_chunks_are_shared_between_snapshots():
+    sim = Simulation(5)
+    first = sim.snapshot()
+    sim.step(Inputs())
+    second = sim.snapshot()
+    assert all(second.chunks[index] is entry for index, entry in first.chunks.items() if index in second.chunks)
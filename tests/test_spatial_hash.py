@@ -0,0 +1,25 @@
+import numpy as np
+
+from main import SpatialHash
+
+
+def test_overlaps_match_brute_force():
+    rng = np.random.default_rng(3)
+    boxes = rng.uniform(-20, 60, (2, 300))
+    widths, heights = rng.uniform(0.2, 1.5, 300), rng.uniform(0.2, 2, 300)
+    ids = rng.permutation(1000)[:300]
+    grid = SpatialHash()
+    grid.build(ids, boxes[0], boxes[1], widths, heights)
+
+    queries = rng.uniform(-20, 60, (2, 200))
+    width, height = 1.0, 2.0
+    found = set(zip(*(array.tolist() for array in grid.overlaps(queries[0], queries[1], width, height))))
+
+    expected = set()
+    for query, (left, top) in enumerate(queries.T):
+        for i in range(300):
+            if left < boxes[0, i] + widths[i] and boxes[0, i] < left + width and \
+                    top < boxes[1, i] + heights[i] and boxes[1, i] < top + height:
+                expected.add((query, int(ids[i])))
+    assert found == expected
+    assert expected
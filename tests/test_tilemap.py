@@ -0,0 +1,31 @@
+import random
+
+import pytest
+
+from main import BLOCK_PARTS, CHUNK_H, CHUNK_W, PT, TileMap
+
+
+def test_set_and_get_keep_the_solidity_masks_current():
+    tiles = TileMap()
+    rng = random.Random(4)
+    written = {}
+    for _ in range(3000):
+        x, y, pt = rng.randrange(-2 * CHUNK_W, 3 * CHUNK_W), rng.randrange(CHUNK_H), rng.choice(list(PT))
+        tiles.set(x, y, pt)
+        written[(x, y)] = pt
+    for (x, y), pt in written.items():
+        assert tiles.get(x, y) == pt
+    for x in range(-2 * CHUNK_W, 3 * CHUNK_W):
+        mask = sum(1 << y for y in range(CHUNK_H) if tiles.get(x, y) in BLOCK_PARTS)
+        assert tiles.column_mask(x) == mask, x
+
+
+def test_outside_of_the_chunks():
+    tiles = TileMap()
+    assert tiles.get(5, 5) == PT.BLANK
+    assert tiles.get(5, -1) == PT.BLANK
+    assert tiles.column_mask(5) == 0
+    tiles.set(5, 5, PT.BLANK)
+    assert not tiles.chunks
+    with pytest.raises(IndexError):
+        tiles.set(5, CHUNK_H, PT.BRICK)